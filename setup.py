@@ -4,9 +4,8 @@
 # To rebuild just the cython modules, use these commands:
 # sudo apt-get install python-setuptools cython
 # python3 setup.py build_ext --inplace
-from __future__ import division, print_function
-
 from setuptools import setup, find_packages
+from setuptools.command.build_py import build_py
 from Cython.Build import cythonize # Warning: must be _after_ setup import
 import glob
 import os
@@ -113,6 +112,20 @@ else:
     scripts = []
     sys.stderr.write("Warning: Platform %s not supported" % sys.platform)
 
+class build_py_version(build_py):
+    """
+    Same as build_py, but also generates odemis/_version.py, so that the
+    installed package doesn't need to look for its version at every import.
+    """
+    def run(self):
+        build_py.run(self)
+        if not self.dry_run:
+            path = os.path.join(self.build_lib, "odemis", "_version.py")
+            with open(path, "w") as f:
+                f.write("# Generated by setup.py, do not edit\n"
+                        "__version__ = \"%s\"\n" % (VERSION,))
+
+
 dist = setup(name='Odemis',
              version=VERSION,
              description='Open Delmic Microscope Software',
@@ -135,6 +148,7 @@ dist = setup(name='Odemis',
                           },
              ext_modules=cythonize(glob.glob(os.path.join("src", "odemis", "util", "*.pyx")), language_level=3),
              scripts=scripts,
+             cmdclass={"build_py": build_py_version},
              data_files=data_files,  # not officially in setuptools, but works as for distutils
              include_dirs=[numpy.get_include()],
             )
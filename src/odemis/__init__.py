@@ -23,7 +23,6 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 from __future__ import division
 import logging
 import os
-import subprocess
 
 # Generic metadata about the package
 
@@ -32,35 +31,56 @@ def _get_version_git():
     Get the version via git
     raises LookupError if no version info found
     """
+    import subprocess
+    from odemis._gitrefs import get_version_git_refs
+
     # change directory to root
     rootdir = os.path.join(os.path.dirname(__file__), "..", "..") # odemis/src/odemis/../..
 
-    if not os.path.isdir(rootdir) or not os.path.isdir(os.path.join(rootdir, ".git")):
+    gitdir = os.path.join(rootdir, ".git")
+    if not os.path.isdir(rootdir) or not os.path.isdir(gitdir):
         raise LookupError("Not in a git directory")
 
+    # Fast path: on a tagged commit, the references are enough, and it avoids
+    # starting a new process (which is slow, compared to the rest of the import).
+    # Local modifications are not detected, so there is no "-dirty" suffix.
     try:
-        out = subprocess.check_output(args=["git", "describe", "--tags", "--dirty", "--always"],
-                                      cwd=rootdir)
-        ver = out.strip().decode("utf-8", errors="replace")
-        if ver.startswith("v"):
-            ver = ver[1:]
-        return ver
-    except OSError:
-        raise LookupError("Unable to run git")
-    except subprocess.CalledProcessError as ex:
-        logging.warning("Failed to run git: %s", ex)
-        raise LookupError("Execution of git failed")
+        ver = get_version_git_refs(gitdir)
+    except LookupError:
+        try:
+            out = subprocess.check_output(args=["git", "describe", "--tags", "--dirty", "--always"],
+                                          cwd=rootdir)
+            ver = out.strip().decode("utf-8", errors="replace")
+        except OSError:
+            raise LookupError("Unable to run git")
+        except subprocess.CalledProcessError as ex:
+            logging.warning("Failed to run git: %s", ex)
+            raise LookupError("Execution of git failed")
+
+    if ver.startswith("v"):
+        ver = ver[1:]
+    return ver
 
 
 def _get_version_setuptools():
     """
-    Gets the version via setuptools/pkg_resources
+    Gets the version via the package metadata (importlib.metadata, or
+    setuptools/pkg_resources on Python < 3.8)
     raises LookupError if no version info found
     """
-    import pkg_resources
     try:
-        return pkg_resources.get_distribution("odemis").version
-    except pkg_resources.DistributionNotFound:
+        # Much faster than pkg_resources, as it doesn't scan all the packages
+        from importlib.metadata import version, PackageNotFoundError
+    except ImportError:
+        import pkg_resources
+        try:
+            return pkg_resources.get_distribution("odemis").version
+        except pkg_resources.DistributionNotFound:
+            raise LookupError("Not packaged via setuptools")
+
+    try:
+        return version("odemis")
+    except PackageNotFoundError:
         raise LookupError("Not packaged via setuptools")
 
 def _get_version():
@@ -91,7 +111,11 @@ def get_version_simplified():
     return ".".join(__version__.split("-")[:2])
 
 
-__version__ = _get_version()
+try:
+    # Generated when building the package (cf setup.py)
+    from odemis._version import __version__
+except ImportError:
+    __version__ = _get_version()
 __fullname__ = "Open Delmic Microscope Software"
 __shortname__ = "Odemis"
 __copyright__ = "Copyright © 2012-2022 Delmic"
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 16 Oct 2026
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+
+# Reads the version from the git references, without running git.
+
+import logging
+import os
+import zlib
+
+
+def get_version_git_refs(gitdir):
+    """
+    Get the version by directly reading the git references (without running git).
+    It only works if HEAD is exactly on a tag, in which case "git describe"
+    would just return the name of the tag. If several tags are on HEAD, the
+    first one in alphabetical order is returned. Note that it cannot detect
+    whether the working directory is "dirty".
+    gitdir (str): path to the .git directory
+    return (str): the name of the tag
+    raises LookupError if HEAD is not on a tag (or the references cannot be read)
+    """
+    refs = {}  # str (full ref name) -> str (SHA-1 of the commit)
+    try:
+        with open(os.path.join(gitdir, "packed-refs"), "r") as f:
+            prev_ref = None
+            for l in f:
+                l = l.strip()
+                if not l or l.startswith("#"):
+                    continue
+                if l.startswith("^"):
+                    # Commit pointed by the previous (annotated) tag
+                    if prev_ref is not None:
+                        refs[prev_ref] = l[1:]
+                    continue
+                sha, _, prev_ref = l.partition(" ")
+                refs[prev_ref] = sha
+    except OSError:
+        pass  # No packed refs, that's fine
+
+    # Loose refs take precedence over the packed ones. Annotated tags point to
+    # a tag object, which is peeled to get the commit.
+    tagsdir = os.path.join(gitdir, "refs", "tags")
+    for root, _, files in os.walk(tagsdir):
+        for fn in files:
+            path = os.path.join(root, fn)
+            name = "refs/tags/" + os.path.relpath(path, tagsdir).replace(os.sep, "/")
+            try:
+                with open(path, "r") as f:
+                    refs[name] = _peel_tag(gitdir, f.read().strip())
+            except OSError:
+                pass
+
+    try:
+        with open(os.path.join(gitdir, "HEAD"), "r") as f:
+            head = f.read().strip()
+        if head.startswith("ref: "):
+            ref = head[5:]
+            try:
+                with open(os.path.join(gitdir, ref), "r") as f:
+                    head = f.read().strip()
+            except OSError:
+                head = refs[ref]
+    except (OSError, KeyError):
+        raise LookupError("Failed to read the git HEAD")
+
+    # Sorted, so that the result doesn't depend on the order the refs were read
+    tags = sorted(name[len("refs/tags/"):] for name, sha in refs.items()
+                  if name.startswith("refs/tags/") and sha == head)
+    if not tags:
+        raise LookupError("HEAD is not on a tag")
+    if len(tags) > 1:
+        logging.debug("HEAD has multiple tags %s, picking the first one", tags)
+    return tags[0]
+
+
+def _peel_tag(gitdir, sha):
+    """
+    Find the commit pointed by an annotated tag, when stored as a loose object
+    gitdir (str): path to the .git directory
+    sha (str): SHA-1 of the object referenced by the tag
+    return (str): SHA-1 of the commit of the annotated tag, or sha if it's not
+      an annotated tag (or the object is packed, and so cannot be easily read).
+    """
+    try:
+        with open(os.path.join(gitdir, "objects", sha[:2], sha[2:]), "rb") as f:
+            obj = zlib.decompress(f.read())
+    except (OSError, zlib.error):
+        return sha  # Not a loose object, it's most likely a commit (or packed)
+
+    # Tag object: "tag <size>\0object <sha>\ntype commit\n..."
+    if obj.startswith(b"tag "):
+        content = obj.partition(b"\0")[2]
+        for l in content.split(b"\n"):
+            if l.startswith(b"object "):
+                return l[7:].strip().decode("ascii")
+            if not l:  # End of the header
+                break
+    return sha
@@ -249,7 +249,8 @@ def MatchCoordinates(input_coordinates, electron_coordinates, guess_scale, max_a
     """
     Orders the list of spot coordinates of the grid in the electron image in order to
     match the corresponding spot coordinates generated by FindCenterCoordinates.
-    input_coordinates (List of tuples): Coordinates of spots in optical image
+    input_coordinates (List of tuples, or ndarray of shape Nx2): Coordinates of
+      spots in optical image
     electron_coordinates (List of tuples): Coordinates of spots in electron image
     guess_scale (float): Guess scaling for the first transformation
     max_allowed_diff (float): Maximum allowed difference in electron coordinates (in px)
@@ -511,8 +512,8 @@ def _MatchAndCalculate(transformed_coordinates, optical_coordinates, electron_co
 def _FindOuterOutliers(x_coordinates):
     """
     Removes large outliers from the optical coordinates.
-    x_coordinates (List of tuples): List of coordinates
-    returns (List of tuples): Coordinates without outer outliers
+    x_coordinates (List of tuples, or ndarray of shape Nx2): List of coordinates
+    returns (List of tuples or of 1D ndarrays): Coordinates without outer outliers
     """
     # For each point, search for the 2 closest neighbors
     points = numpy.array(x_coordinates)
@@ -20,18 +20,14 @@ You should have received a copy of the GNU General Public License along with
 Odemis. If not, see http://www.gnu.org/licenses/.
 """
 
-from __future__ import division
-
 from collections import OrderedDict
-from concurrent.futures._base import CancelledError, CANCELLED, FINISHED, \
-    RUNNING
-import heapq
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from concurrent.futures._base import CANCELLED, FINISHED, RUNNING
 import logging
 import math
 import numpy
 from odemis import model
 from odemis import util
-from odemis.dataio import tiff
 from odemis.util import TimeoutError, spot, executeAsyncTask
 from odemis.util.img import Subtract
 import os
@@ -138,18 +134,20 @@ def _DoFindOverlay(future, repetitions, dwell_time, max_allowed_diff, escan,
             # For making a report when a failure happens
             report = OrderedDict()  # Description (str) -> value (str()'able)
             optical_image = None
+            # Note: the pixel size is the same before and after the acquisition
+            sem_pxs = escan.pixelSize.value
+            sem_mag = escan.magnification.value
             report["Grid size"] = repetitions
-            report["SEM magnification"] = escan.magnification.value
-            report["SEM pixel size"] = escan.pixelSize.value
-            report["SEM FoV"] = tuple(s * p for s, p in zip(escan.shape, escan.pixelSize.value))
+            report["SEM magnification"] = sem_mag
+            report["SEM pixel size"] = sem_pxs
+            report["SEM FoV"] = tuple(s * p for s, p in zip(escan.shape, sem_pxs))
             report["Maximum difference allowed"] = max_allowed_diff
             report["Dwell time"] = dwell_time
             subimages = []
 
             try:
                 # Grid scan
-                if future._find_overlay_state == CANCELLED:
-                    raise CancelledError()
+                _checkCancelled(future)
 
                 # Update progress of the future (it may be the second trial)
                 future.set_progress(end=time.time() +
@@ -160,34 +158,36 @@ def _DoFindOverlay(future, repetitions, dwell_time, max_allowed_diff, escan,
                 optical_image, electron_coordinates, electron_scale = future._gscanner.DoAcquisition()
                 report["Spots coordinates in SEM ref"] = electron_coordinates
 
-                if future._find_overlay_state == CANCELLED:
-                    raise CancelledError()
+                _checkCancelled(future)
 
                 # Update remaining time to 6secs (hardcoded estimation)
                 future.set_progress(end=time.time() + 6)
 
                 # Check if ScanGrid gave one image or list of images
                 # If it is a list, follow the "one image per spot" procedure
+                per_spot = isinstance(optical_image, list)
+                opt_images = optical_image if per_spot else [optical_image]
+                opxs = opt_images[0].metadata[model.MD_PIXEL_SIZE]
+                opt_img_shape = opt_images[0].shape
+
                 logging.debug("Isolating spots...")
-                if isinstance(optical_image, list):
+                if per_spot:
                     report["Acquisition method"] = "One image per spot"
-                    opxs = optical_image[0].metadata[model.MD_PIXEL_SIZE]
-                    opt_img_shape = optical_image[0].shape
-                    subimage_coordinates = []
-                    for oimg in optical_image:
-                        subspots, subspot_coordinates = coordinates.DivideInNeighborhoods(oimg, (1, 1), oimg.shape[0] / 2)
-                        subimages.append(subspots[0])
-                        subimage_coordinates.append(subspot_coordinates[0])
+                    # Each image is processed independently, mostly within
+                    # numpy/scipy, which release the GIL => use all the CPUs.
+                    # The spot center is found in the same go.
+                    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+                        spots = list(executor.map(_findSingleSpot, opt_images))
+                    subimages = [s[0] for s in spots]
+                    subimage_coordinates = [s[1] for s in spots]
+                    spot_coordinates = [s[2] for s in spots]
                 else:
                     report["Acquisition method"] = "Whole image"
                     # Distance between spots in the optical image (in optical pixels)
-                    opxs = optical_image.metadata[model.MD_PIXEL_SIZE]
-                    optical_dist = escan.pixelSize.value[0] * electron_scale[0] / opxs[0]
-                    opt_img_shape = optical_image.shape
+                    optical_dist = sem_pxs[0] * electron_scale[0] / opxs[0]
 
                     # Isolate spots
-                    if future._find_overlay_state == CANCELLED:
-                        raise CancelledError()
+                    _checkCancelled(future)
 
                     subimages, subimage_coordinates = coordinates.DivideInNeighborhoods(optical_image, repetitions, optical_dist)
 
@@ -201,16 +201,17 @@ def _DoFindOverlay(future, repetitions, dwell_time, max_allowed_diff, escan,
                     logging.warning("The maximum distance is very small compared to the optical pixel size: "
                                     "%g m vs %g m", max_allowed_diff, opxs[0])
 
-                # Find the centers of the spots
-                if future._find_overlay_state == CANCELLED:
-                    raise CancelledError()
-                logging.debug("Finding spot centers with %d subimages...", len(subimages))
-                spot_coordinates = [spot.FindCenterCoordinates(i) for i in subimages]
+                # Find the centers of the spots (already done if one image per spot)
+                if not per_spot:
+                    _checkCancelled(future)
+                    logging.debug("Finding spot centers with %d subimages...", len(subimages))
+                    spot_coordinates = [spot.FindCenterCoordinates(i) for i in subimages]
 
                 # Reconstruct the optical coordinates
-                if future._find_overlay_state == CANCELLED:
-                    raise CancelledError()
+                _checkCancelled(future)
                 optical_coordinates = coordinates.ReconstructCoordinates(subimage_coordinates, spot_coordinates)
+                # From now on, handle the coordinates as one array of N x 2 floats
+                optical_coordinates = numpy.array(optical_coordinates, dtype=float)
 
                 # Check if SEM calibration is correct. If this is not the case
                 # generate a warning message and provide the ratio of X/Y scale.
@@ -221,28 +222,25 @@ def _DoFindOverlay(future, repetitions, dwell_time, max_allowed_diff, escan,
                 else:
                     logging.info("SEM X/Y ratio is %f.", ratio)
 
-                opt_offset = (opt_img_shape[1] / 2, opt_img_shape[0] / 2)
-                optical_coordinates = [(x - opt_offset[0], y - opt_offset[1]) for x, y in optical_coordinates]
-                report["Spots coordinates in Optical ref"] = optical_coordinates
+                opt_offset = numpy.array((opt_img_shape[1], opt_img_shape[0])) / 2  # X, Y
+                optical_coordinates -= opt_offset
+                report["Spots coordinates in Optical ref"] = optical_coordinates.tolist()
 
                 # Estimate the scale by measuring the distance between the closest
                 # two spots in optical and electron coordinates.
                 #  * For electrons, it's easy as we've placed them.
                 #  * For optical, we pick one spot, and measure the distance to the
                 #    closest spot.
-                p1 = optical_coordinates[0]
-                def dist_to_p1(p):
-                    return math.hypot(p1[0] - p[0], p1[1] - p[1])
-                optical_dist = min(dist_to_p1(p) for p in optical_coordinates[1:])
+                diffs = optical_coordinates[1:] - optical_coordinates[0]
+                optical_dist = numpy.hypot(diffs[:, 0], diffs[:, 1]).min()
                 scale = electron_scale[0] / optical_dist
                 report["Estimated scale"] = scale
 
                 # max_allowed_diff in pixels
-                max_allowed_diff_px = max_allowed_diff / escan.pixelSize.value[0]
+                max_allowed_diff_px = max_allowed_diff / sem_pxs[0]
 
                 # Match the electron to optical coordinates
-                if future._find_overlay_state == CANCELLED:
-                    raise CancelledError()
+                _checkCancelled(future)
 
                 logging.debug("Matching coordinates...")
                 try:
@@ -258,11 +256,7 @@ def _DoFindOverlay(future, repetitions, dwell_time, max_allowed_diff, escan,
                 report["Maximum distance between matches"] = max_diff
 
                 # Calculate transformation parameters
-                if future._find_overlay_state == CANCELLED:
-                    raise CancelledError()
-
-                # We are almost done... about 1 s left
-                future.set_progress(end=time.time() + 1)
+                _checkCancelled(future)
 
                 logging.debug("Calculating transformation...")
                 try:
@@ -270,15 +264,14 @@ def _DoFindOverlay(future, repetitions, dwell_time, max_allowed_diff, escan,
                 except ValueError as exp:
                     raise OverlayError("Failed to calculate transformation: %s" % (exp,))
 
-                if future._find_overlay_state == CANCELLED:
-                    raise CancelledError()
+                _checkCancelled(future)
 
                 logging.debug("Calculating transform metadata...")
                 if skew is True:
-                    transform_d, skew_d = _transformMetadata(optical_image, ret, escan, ccd, skew)
+                    transform_d, skew_d = _transformMetadata(opxs, ret, sem_pxs, skew)
                     transform_data = (transform_d, skew_d)
                 else:
-                    transform_d = _transformMetadata(optical_image, ret, escan, ccd, skew)  # Also indicate which dwell time eventually worked
+                    transform_d = _transformMetadata(opxs, ret, sem_pxs, skew)  # Also indicate which dwell time eventually worked
                     transform_data = transform_d
                 transform_d[model.MD_DWELL_TIME] = dwell_time
 
@@ -308,6 +301,14 @@ def _DoFindOverlay(future, repetitions, dwell_time, max_allowed_diff, escan,
             future._find_overlay_state = FINISHED
 
 
+def _checkCancelled(future):
+    """
+    raises CancelledError if the overlay procedure has been cancelled
+    """
+    if future._find_overlay_state == CANCELLED:
+        raise CancelledError()
+
+
 def _CancelFindOverlay(future):
     """
     Canceller of _DoFindOverlay task.
@@ -326,40 +327,65 @@ def _CancelFindOverlay(future):
     return True
 
 
+def _findSingleSpot(image):
+    """
+    Finds the spot in an image which contains only one spot.
+    image (model.DataArray): 2D array containing the intensity of each pixel
+    returns subimage (model.DataArray): the region around the spot
+            subimage_coordinates (tuple): the coordinates of the center of the
+              subimage with respect to the overall image
+            spot_coordinates (tuple of 2 floats): the coordinates of the
+              center of the spot, relative to the center of the subimage
+    """
+    subspots, subspot_coordinates = coordinates.DivideInNeighborhoods(image, (1, 1), image.shape[0] / 2)
+    return subspots[0], subspot_coordinates[0], spot.FindCenterCoordinates(subspots[0])
+
+
 def _computeGridRatio(coord, shape):
     """
-    coord (list of tuple of 2 floats): coordinates
+    coord (list of tuple of 2 floats, or ndarray of shape Nx2): coordinates
     shape (2 ints): X and Y number of coordinates
     return (float): ratio X/Y
     """
-    x_cors = [i[0] for i in coord]
-    y_cors = [i[1] for i in coord]
-    x_max_cors = numpy.mean(heapq.nlargest(shape[0], x_cors))
-    x_min_cors = numpy.mean(heapq.nsmallest(shape[0], x_cors))
-    y_max_cors = numpy.mean(heapq.nlargest(shape[1], y_cors))
-    y_min_cors = numpy.mean(heapq.nsmallest(shape[1], y_cors))
-    x_scale = x_max_cors - x_min_cors
-    y_scale = y_max_cors - y_min_cors
+    coord = numpy.asarray(coord, dtype=float)
+    x_scale = _extremesDistance(coord[:, 0], shape[0])
+    y_scale = _extremesDistance(coord[:, 1], shape[1])
     return x_scale / y_scale
 
 
+def _extremesDistance(values, n):
+    """
+    values (1D ndarray of floats)
+    n (int): number of values to consider on each extreme
+    return (float): difference between the mean of the n largest values and the
+      mean of the n smallest values
+    """
+    n = min(n, values.size)
+    largest = numpy.partition(values, -n)[-n:]
+    smallest = numpy.partition(values, n - 1)[:n]
+    return largest.mean() - smallest.mean()
+
+
 def estimateOverlayTime(dwell_time, repetitions):
     """
     Estimates overlay procedure duration
     """
-    return 6 + dwell_time * numpy.prod(repetitions)  # s
+    return 6 + dwell_time * repetitions[0] * repetitions[1]  # s
 
 
-def _transformMetadata(optical_image, transformation_values, escan, ccd, skew=False):
+def _transformMetadata(opt_pxs, transformation_values, escan_pxs, skew=False):
     """
     Converts the transformation values into metadata format
+    opt_pxs (tuple of 2 floats): pixel size of the optical image(s) (in m)
+    transformation_values (tuple): as returned by transform.CalculateTransform()
+    escan_pxs (tuple of 2 floats): pixel size of the e-beam scanner (in m)
+    skew (boolean): If True, transformation_values also contains the skew
     Returns:
         opt_md (dict of MD_ -> values): metadata for the optical image with
          ROTATION_COR, POS_COR, and PIXEL_SIZE_COR set
         skew_md (dict of MD_ -> values): metadata for SEM image with
          SHEAR_COR and PIXEL_SIZE_COR set
     """
-    escan_pxs = escan.pixelSize.value
     logging.debug("Ebeam pixel size: %g ", escan_pxs[0])
     if skew is False:
         ((calc_translation_x, calc_translation_y),
@@ -384,17 +410,8 @@ def _transformMetadata(optical_image, transformation_values, escan, ccd, skew=Fa
                     scale[1] * calc_translation_y)
     logging.debug("Center shift correction: %s", position_cor)
     transform_md[model.MD_POS_COR] = position_cor
-    if isinstance(optical_image, list):
-        opt_img_pxs = optical_image[0]
-    else:
-        opt_img_pxs = optical_image
-    try:
-        pixel_size = opt_img_pxs.metadata[model.MD_PIXEL_SIZE]
-    except KeyError:
-        logging.warning("No MD_PIXEL_SIZE data available")
-        return transform_md
-    pixel_size_cor = (scale[0] / pixel_size[0],
-                      scale[1] / pixel_size[1])
+    pixel_size_cor = (scale[0] / opt_pxs[0],
+                      scale[1] / opt_pxs[1])
     logging.debug("Pixel size correction: %s", pixel_size_cor)
     transform_md[model.MD_PIXEL_SIZE_COR] = pixel_size_cor
 
@@ -417,25 +434,32 @@ def _MakeReport(msg, data, optical_image=None, subimages=None):
     """
     path = os.path.join(os.path.expanduser(u"~"), u"odemis-overlay-report",
                         time.strftime(u"%Y%m%d-%H%M%S"))
-    os.makedirs(path)
-
-    report = open(os.path.join(path, u"report.txt"), 'w')
-    report.write("****Overlay Failure Report****\n")
-    report.write("%s\n" % (msg,))
+    # The directory may already exist if two reports are made within the same second
+    os.makedirs(path, exist_ok=True)
 
+    lines = ["****Overlay Failure Report****",
+             "%s" % (msg,)]
     if optical_image is not None:
-        tiff.export(os.path.join(path, u"OpticalGrid.tiff"), optical_image)
-        report.write("The optical image of the grid can be seen in OpticalGrid.tiff\n")
-
+        lines.append("The optical image of the grid can be seen in OpticalGrid.tiff")
     if subimages is not None:
-        tiff.export(os.path.join(path, u"OpticalPartitions.tiff"), subimages)
-        report.write("The partitioned optical images can be seen in OpticalPartitions.tiff\n")
+        lines.append("The partitioned optical images can be seen in OpticalPartitions.tiff")
+    lines.append("")
+    lines.extend("%s:\t%s" % (desc, val) for desc, val in data.items())
+
+    # Write the text report first, so that it's available even if exporting
+    # the images fails
+    with open(os.path.join(path, u"report.txt"), 'w') as report:
+        report.write("\n".join(lines) + "\n")
+
+    if optical_image is not None or subimages is not None:
+        # Only needed in case of failure, so no need to load libtiff before
+        from odemis.dataio import tiff
 
-    report.write("\n")
-    for desc, val in data.items():
-        report.write("%s:\t%s\n" % (desc, val))
+        if optical_image is not None:
+            tiff.export(os.path.join(path, u"OpticalGrid.tiff"), optical_image)
+        if subimages is not None:
+            tiff.export(os.path.join(path, u"OpticalPartitions.tiff"), subimages)
 
-    report.close()
     logging.warning("Failed to find overlay. Please check the failure report in %s.",
                     path)
 
@@ -22,14 +22,24 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 
 from __future__ import division
 
+from functools import lru_cache
 import logging
 import numpy
 import math
 
 from numpy import arange
-from numpy import fft
 
-def MeasureShift(previous_img, current_img, precision=1):
+try:
+    # Faster than numpy.fft, in particular for real input
+    from scipy import fft
+    # Run the FFTs over all the CPU cores, which helps with large images
+    _FFT_KWARGS = {"workers": -1}
+except ImportError:  # scipy < 1.4
+    from numpy import fft
+    _FFT_KWARGS = {}
+
+def MeasureShift(previous_img, current_img, precision=1, previous_fft=None, current_fft=None,
+                 window=False):
     """
     Given two images, it calculates the shift in x and y axis. It first computes
     the cross-correlation of the two images and then locates the peak. The coordinates
@@ -43,122 +53,155 @@ def MeasureShift(previous_img, current_img, precision=1):
     current_img (numpy.array): 2d array with the last frame, must be of same
       shape as previous_img
     precision (1<=int): Calculate drift within 1/precision of a pixel
+    previous_fft (None or numpy.array): spectrum of previous_img, as returned by
+      ComputeShiftSpectrum() with the same precision. If None, it is computed.
+      Useful when the same image is compared several times.
+    current_fft (None or numpy.array): spectrum of current_img, as previous_fft.
+    window (bool): if True, a Hann window is applied to the images before
+      computing their spectra. This reduces the edge artifacts, which helps
+      when the images are not periodic, but it works less well with large
+      shifts. Passed to ComputeShiftSpectrum() when computing the spectra.
     returns (tuple of floats): Drift in pixels
     """
     if precision < 1:
         raise ValueError("Precision cannot be less than 1, got %s." % (precision,))
     assert previous_img.shape == current_img.shape, "Prev shape %s != new shape %s" % (previous_img.shape, current_img.shape)
 
-    previous_fft = fft.fft2(previous_img)
-    current_fft = fft.fft2(current_img)
-    m, n = previous_fft.shape
+    m, n = previous_img.shape
 
+    if previous_fft is None:
+        previous_fft = ComputeShiftSpectrum(previous_img, precision, window)
+
+    # Cross-power spectrum, computed in place to avoid temporary arrays
+    if current_fft is None:
+        current_fft = ComputeShiftSpectrum(current_img, precision, window)
+        cps = numpy.conjugate(current_fft, out=current_fft)
+    else:
+        # The spectrum belongs to the caller, so it must not be modified
+        cps = numpy.conjugate(current_fft)
+    cps *= previous_fft
+
+    # Cross-correlation computation
     if precision == 1:
-        # Cross-correlation computation
-        CC = fft.ifft2(previous_fft * current_fft.conj())
-
-        # Locate the peak
-        ACC = abs(CC)
-        loc1 = ACC.argmax(0)
-        max1 = ACC[(loc1, range(ACC.shape[1]))]
-        loc2 = max1.argmax(0)
-
-        rloc = loc1[loc2]
-        cloc = loc2
-
-        # Calculate shift from the peak
-        md2 = m // 2
-        nd2 = n // 2
-        if rloc > md2:
-            row_shift = rloc - m
-        else:
-            row_shift = rloc
-
-        if cloc > nd2:
-            col_shift = cloc - n
-        else:
-            col_shift = cloc
+        CC = fft.irfft2(cps, s=(m, n), **_FFT_KWARGS)
+    else:
+        CC = fft.ifft2(cps, **_FFT_KWARGS)
 
+    # Locate the peak
+    rloc, cloc = _findPeak(CC)
+
+    # Calculate shift from the peak
+    md2 = m // 2
+    nd2 = n // 2
+    if rloc > md2:
+        row_shift = rloc - m
+    else:
+        row_shift = rloc
+
+    if cloc > nd2:
+        col_shift = cloc - n
     else:
-        mlarge, nlarge = m * 2, n * 2
-
-        # Upsample by factor of 2 to obtain initial estimation and
-        # embed Fourier data in a 2x larger array
-        CC = numpy.zeros((mlarge, nlarge), dtype=numpy.complex)
-        CC[m - m // 2:m + 1 + (m - 1) // 2,
-           n - n // 2:n + 1 + (n - 1) // 2] = (fft.fftshift(previous_fft) *
-                                               fft.fftshift(current_fft).conj()
-                                              )
-
-        # Cross-correlation computation
-        CC = fft.ifft2(fft.ifftshift(CC))
-
-        # Locate the peak
-        ACC = abs(CC)
-        loc1 = ACC.argmax(0)
-        max1 = ACC[(loc1, range(ACC.shape[1]))]
-        loc2 = max1.argmax(0)
-
-        rloc = loc1[loc2]
-        cloc = loc2
-
-        # Calculate shift in previous pixel grid from the position of the peak
-        (m, n) = CC.shape
-        md2 = m // 2
-        nd2 = n // 2
-
-        if rloc > md2:
-            row_shift = rloc - m
-        else:
-            row_shift = rloc
-
-        if cloc > nd2:
-            col_shift = cloc - n
-        else:
-            col_shift = cloc
-
-        row_shift /= 2
-        col_shift /= 2
-
-        # DFT computation
-        # Initial shift estimation in upsampled grid
-        row_shift = round(row_shift * precision) / precision
-        col_shift = round(col_shift * precision) / precision
-        dft_shift = math.ceil(precision * 1.5) // 2  # Center of output at dft_shift+1
+        col_shift = cloc
+
+    if precision > 1:
+        # The integer shift is within 0.5 px of the actual shift, so there is
+        # no need to first upsample by a factor of 2 (as in the original
+        # algorithm): the upsampled DFT covers 1.5 px around the estimation.
+        upsampled_size = (precision * 3 + 1) // 2  # = ceil(precision * 1.5)
+        dft_shift = upsampled_size // 2  # Center of output at dft_shift+1
 
         # Matrix multiply DFT around the current shift estimation
-        CC = (_UpsampledDFT(current_fft * previous_fft.conj(),
-                            math.ceil(precision * 1.5),
-                            math.ceil(precision * 1.5),
+        CC = (_UpsampledDFT(cps.conj(),
+                            upsampled_size,
+                            upsampled_size,
                             precision,
                             dft_shift - row_shift * precision,
                             dft_shift - col_shift * precision)
-              ) / (md2 * nd2 * (precision ** 2))
-        # was .conj(), but as we just need the abs(), it's not needed
+              ) / (m * n * (precision ** 2))
+        # was .conj(), but as only the magnitude is used, it's not needed
 
         # Locate maximum and map back to original pixel grid
-        ACC = abs(CC)
-        loc1 = ACC.argmax(0)
-        max1 = ACC[(loc1, range(ACC.shape[1]))]
-        loc2 = max1.argmax(0)
-
-        rloc = loc1[loc2]
-        cloc = loc2
-
+        rloc, cloc = _findPeak(CC)
         rloc -= dft_shift
         cloc -= dft_shift
 
         row_shift += rloc / precision
         col_shift += cloc / precision
 
-        if md2 == 1:
+        if m == 1:
             row_shift = 0
-        if nd2 == 1:
+        if n == 1:
             col_shift = 0
 
     return col_shift, row_shift
 
 
+def ComputeShiftSpectrum(image, precision=1, window=False):
+    """
+    Computes the spectrum of an image, as used by MeasureShift()
+    image (numpy.array): 2d array
+    precision (1<=int): the precision which will be passed to MeasureShift()
+    window (bool): if True, a Hann window is applied to the image first
+    returns (numpy.array of complex): the spectrum, to be passed as previous_fft
+      or current_fft to MeasureShift(). It must not be modified.
+    """
+    # Single precision is plenty to locate the peak, and (with scipy) halves
+    # the memory used by the spectrum and speeds up the FFTs.
+    image = numpy.asarray(image, dtype=numpy.float32)
+    if window:
+        image = image * _hannWindow(image.shape)
+    if precision == 1:
+        # As the images are real, only half of the spectrum is needed
+        return fft.rfft2(image, **_FFT_KWARGS)
+    else:
+        # The whole spectrum is needed for the upsampled DFT
+        return fft.fft2(image, **_FFT_KWARGS)
+
+
+@lru_cache(maxsize=4)
+def _hannWindow(shape):
+    """
+    Computes a 2D Hann window. As it only depends on the shape, it's cached.
+    shape (int, int): shape of the image
+    returns (numpy.array of float32): the window. It must not be modified.
+    """
+    win = numpy.outer(numpy.hanning(shape[0]), numpy.hanning(shape[1])).astype(numpy.float32)
+    win.flags.writeable = False
+    return win
+
+
+def _findPeak(data):
+    """
+    Locates the maximum magnitude of an array
+    data (numpy.array): 2d array of real or complex values
+    returns (int, int): row and column of the peak
+    """
+    # The squared magnitude has the same maximum as the magnitude, and is
+    # cheaper to compute, as there is no square root.
+    if numpy.iscomplexobj(data):
+        mag2 = data.real * data.real + data.imag * data.imag
+    else:
+        mag2 = data * data
+    return divmod(int(mag2.argmax()), data.shape[1])
+
+
+@lru_cache(maxsize=16)
+def _dftFrequencies(n, precision):
+    """
+    Computes the (scaled) frequencies of the upsampled DFT kernel. As they only
+    depend on the image shape and precision, they are cached, as MeasureShift()
+    is typically called repeatedly on images of the same shape.
+    n (int): number of pixels along the dimension
+    precision (int): upsampling factor
+    returns (numpy.array of complex): -2iπ/(n*precision) * frequency, in the
+      order of the (non-shifted) FFT. It must not be modified.
+    """
+    freq = fft.ifftshift(arange(n)) - n // 2
+    freq = (-2j * math.pi / (n * precision)) * freq
+    freq.flags.writeable = False
+    return freq
+
+
 def _UpsampledDFT(data, nor, noc, precision=1, roff=0, coff=0):
     """
     Upsampled DFT by matrix multiplies.
@@ -170,18 +213,16 @@ def _UpsampledDFT(data, nor, noc, precision=1, roff=0, coff=0):
                     to a region of interest on the DFT
     returns (tuple of floats): Drift in pixels
     """
-    z = 1j  # imaginary unit
     nr, nc = data.shape
 
-    # Compute kernels and obtain DFT by matrix products
-    kernc = numpy.power(math.e, (-z * 2 * math.pi / (nc * precision)) *
-                                ((fft.ifftshift(arange(0, nc))[:, None]).T - nc // 2) *
-                                (arange(0, noc) - coff)[:, None]
-                       )
-
-    kernr = numpy.power(math.e, (-z * 2 * math.pi / (nr * precision)) *
-                                (fft.ifftshift(arange(0, nr))[:, None] - nr // 2) *
-                                ((arange(0, nor)[:, None]).T - roff)
-                       )
-
-    return numpy.dot(numpy.dot((kernr.transpose()), data), kernc.transpose())
+    # Compute kernels and obtain DFT by matrix products.
+    # The kernels are directly computed in the order needed for the products
+    # (ie, kernr is nor x nr, and kernc is nc x noc), so that they are
+    # contiguous.
+    kernc = numpy.exp(numpy.multiply.outer(_dftFrequencies(nc, precision),
+                                           arange(noc) - coff))
+    kernr = numpy.exp(numpy.multiply.outer(arange(nor) - roff,
+                                           _dftFrequencies(nr, precision)))
+
+    # multi_dot() picks the order of the products with the least operations
+    return numpy.linalg.multi_dot([kernr, data, kernc])
@@ -185,6 +185,18 @@ class TestMatchCoordinates(unittest.TestCase):
         assert 0 <= max_dist < 0.25
         numpy.testing.assert_equal(estimated_coordinates, [(2, 1), (2, 3), (1, 2), (3, 1), (1, 3), (3, 2), (2, 2), (3, 3), (1, 1)])
 
+    def test_precomputed_output_array(self):
+        """
+        Test MatchCoordinates for precomputed output, with the optical coordinates as an array
+        """
+        optical_coordinates = numpy.array([(9.1243, 6.7570), (10.7472, 16.8185), (4.7271, 12.6429), (13.9714, 6.0185), (5.6263, 17.5885), (14.8142, 10.9271), (10.0384, 11.8815), (15.5146, 16.0694), (4.4803, 7.5966)])
+        electron_coordinates = self.electron_coordinates_3x3
+
+        estimated_coordinates, known_optical_coordinates, max_dist = coordinates.MatchCoordinates(optical_coordinates, electron_coordinates, 0.25, 0.25)
+        assert 0 <= max_dist < 0.25
+        numpy.testing.assert_equal(estimated_coordinates, [(2, 1), (2, 3), (1, 2), (3, 1), (1, 3), (3, 2), (2, 2), (3, 3), (1, 1)])
+        numpy.testing.assert_equal(known_optical_coordinates, optical_coordinates)
+
     def test_single_element(self):
         """
         Test MatchCoordinates for single element lists, error should be raised
@@ -37,9 +37,6 @@ logging.getLogger().setLevel(logging.DEBUG)
 # _frm = "%(asctime)s  %(levelname)-7s %(module)-15s: %(message)s"
 # logging.getLogger().handlers[0].setFormatter(logging.Formatter(_frm))
 
-# CONFIG_PATH = os.path.dirname(odemis.__file__) + "/../../install/linux/usr/share/odemis/"
-# SECOM_LENS_CONFIG = CONFIG_PATH + "sim/secom-sim-lens-align.odm.yaml"  # 4x4
-
 
 # arguments used for the creation of basic components
 CONFIG_SED = {"name": "sed", "role": "sed", "channel":5, "limits": [-3, 3]}
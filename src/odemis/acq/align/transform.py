@@ -28,8 +28,10 @@ import math
 def CalculateTransform(optical_coordinates, electron_coordinates, skew=False):
     """
     Returns the translation, scaling and rotation for the optical and electron image coordinates.
-    optical_coordinates (List of tuples): Coordinates of spots in optical image
-    electron_coordinates (List of tuples): Coordinates of spots in electron image
+    optical_coordinates (List of tuples, or ndarray of shape Nx2): Coordinates
+      of spots in optical image
+    electron_coordinates (List of tuples, or ndarray of shape Nx2): Coordinates
+      of spots in electron image
     skew (boolean): If True, also compute scaling ratio and shear
     returns translation (Tuple of 2 floats),
             scaling (Tuple of 2 floats),
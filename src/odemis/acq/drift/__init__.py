@@ -30,7 +30,7 @@ from scipy import misc
 import threading
 import cv2
 
-from odemis.acq.align.shift import MeasureShift
+from odemis.acq.align.shift import MeasureShift, ComputeShiftSpectrum
 
 MIN_RESOLUTION = (20, 20) # seems 10x10 sometimes work, but let's not tent it
 MAX_PIXELS = 128 ** 2  # px
@@ -65,6 +65,8 @@ class AnchoredEstimator(object):
         self.max_drift = (0, 0) # in sem px
 
         self.raw = []  # first 2 and last 2 anchor areas acquired (in order)
+        # id of the anchor area -> anchor area, spectrum, to avoid recomputing it
+        self._spectra = {}
         self._acq_sem_complete = threading.Event()
 
         # Calculate initial translation for anchor region acquisition
@@ -168,11 +170,17 @@ class AnchoredEstimator(object):
             # include also the drift of the previous image.
             # Also, MeasureShift return the shift in image pixels, which is
             # different (usually bigger) from the SEM px.
-            prev_drift = MeasureShift(self.raw[-2], self.raw[-1], 10)
+            # Only keep the spectra of the anchor areas still present
+            self._spectra = {id(d): self._spectra[id(d)] for d in self.raw
+                             if id(d) in self._spectra}
+            cur_fft = self._getSpectrum(self.raw[-1])
+            prev_drift = MeasureShift(self.raw[-2], self.raw[-1], 10,
+                                      self._getSpectrum(self.raw[-2]), cur_fft)
             prev_drift = (prev_drift[0] * self._scale[0] + self.drift[0],
                           prev_drift[1] * self._scale[1] + self.drift[1])
 
-            orig_drift = MeasureShift(self.raw[0], self.raw[-1], 10)
+            orig_drift = MeasureShift(self.raw[0], self.raw[-1], 10,
+                                      self._getSpectrum(self.raw[0]), cur_fft)
             self.drift = (orig_drift[0] * self._scale[0],
                           orig_drift[1] * self._scale[1])
 
@@ -195,6 +203,21 @@ class AnchoredEstimator(object):
 
         return self.drift
 
+    def _getSpectrum(self, data):
+        """
+        Returns the spectrum of an anchor area, as needed by MeasureShift(),
+        computing it only the first time.
+        data (DataArray): one of the anchor areas in .raw
+        return (numpy.array): spectrum of the data
+        """
+        try:
+            return self._spectra[id(data)][1]
+        except KeyError:
+            spectrum = ComputeShiftSpectrum(data, 10)
+            # The data is kept, so that its id cannot be reused by another one
+            self._spectra[id(data)] = (data, spectrum)
+            return spectrum
+
     def estimateAcquisitionTime(self):
         """
         return (float): estimated time to acquire 1 anchor area
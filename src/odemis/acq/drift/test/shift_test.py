@@ -24,9 +24,10 @@ from __future__ import division
 import math
 from numpy import fft
 import numpy
-from odemis.acq.align.shift import MeasureShift
+from odemis.acq.align.shift import MeasureShift, ComputeShiftSpectrum
 from odemis.dataio import hdf5
 import os
+from scipy import ndimage
 import unittest
 
 DATA_DIR = os.path.dirname(__file__)
@@ -136,6 +137,44 @@ class TestMeasureShift(unittest.TestCase):
         drift = MeasureShift(self.data[0], self.data_random_drifted, 1000)
         numpy.testing.assert_almost_equal(drift, (self.deltac, self.deltar), 3)
 
+    def test_precomputed_spectrum(self):
+        """
+        Tests passing the spectra of the images, computed beforehand.
+        """
+        for precision in (1, 10):
+            prev_fft = ComputeShiftSpectrum(self.data[0], precision)
+            cur_fft = ComputeShiftSpectrum(self.data_random_drifted, precision)
+            cur_fft_orig = cur_fft.copy()
+            exp_drift = MeasureShift(self.data[0], self.data_random_drifted, precision)
+            drift = MeasureShift(self.data[0], self.data_random_drifted, precision,
+                                 prev_fft, cur_fft)
+            numpy.testing.assert_almost_equal(drift, exp_drift)
+            # The spectrum passed should not be modified
+            numpy.testing.assert_array_equal(cur_fft, cur_fft_orig)
+
+            # The spectrum can be reused
+            drift = MeasureShift(self.data[0], self.data_random_drifted, precision,
+                                 current_fft=cur_fft)
+            numpy.testing.assert_almost_equal(drift, exp_drift)
+
+    def test_window(self):
+        """
+        Tests for non-periodic images, with and without window.
+        """
+        drift = MeasureShift(self.data[0], self.data_drifted[0], 1, window=True)
+        numpy.testing.assert_almost_equal(drift, (-3, 5), 1)
+
+        # Crop a sub-pixel shifted image, so that the images are not periodic
+        data = self.data[0].astype(float)
+        shifted = ndimage.shift(data, (3.3, -7.6), order=3)
+        data, shifted = data[50:-50, 50:-50], shifted[50:-50, 50:-50]
+        drift = MeasureShift(data, shifted, 100)
+        drift_win = MeasureShift(data, shifted, 100, window=True)
+        numpy.testing.assert_almost_equal(drift_win, (7.6, -3.3), 0)
+        # The window reduces the error caused by the edges
+        self.assertLess(math.hypot(drift_win[0] - 7.6, drift_win[1] + 3.3),
+                        math.hypot(drift[0] - 7.6, drift[1] + 3.3))
+
     def test_identical_inputs_noisy(self):
         """
         Tests for input of identical images after noise is added.
@@ -26,7 +26,6 @@ import logging
 import numpy
 from odemis.gui.util.img import NDImage2wxImage
 from odemis.util import img
-from scipy import ndimage
 import wx
 
 MAX_WIDTH = 2000
@@ -94,8 +93,7 @@ class VideoDisplayer(object):
                 h = leny - int(((v - miny) * leny) / diffy)
                 rgb[h:-1, i[-1], :] = 255
         else: # Greyscale (hopefully)
-            mn, mx, mnp, mxp = ndimage.extrema(data)
-            logging.info("Image data from %s to %s", mn, mx)
+            logging.info("Image data from %s to %s", data.min(), data.max())
             rgb = img.DataArray2RGB(data) # auto brightness/contrast
 
         self.app.img = NDImage2wxImage(rgb)
@@ -142,6 +140,8 @@ class ImageWindowApp(wx.App):
     def update_view(self):
         logging.debug("Received a new image of %d x %d", *self.img.GetSize())
         self.frame.ClientSize = self.img.GetSize()
+        # Note: always use a new bitmap, as modifying the bitmap currently
+        # displayed isn't safe, and setting the same bitmap might not redraw it.
         if wx.MAJOR_VERSION <= 3:
             self.imageCtrl.SetBitmap(wx.BitmapFromImage(self.img))
         else:
@@ -43,6 +43,70 @@ _iomodules = ["tiff", "stiff", "hdf5", "png", "csv", "catmaid"]
 __all__ = _iomodules + ["get_available_formats", "get_converter", "find_fittest_converter"]
 
 
+# List of the format modules which could be loaded, in the same order as
+# _iomodules. None until _get_iomodules() is called the first time.
+_loaded_iomodules = None
+
+
+def _get_iomodules():
+    """
+    Load the format modules. They are loaded only the first time, and the same
+    list is returned on the next calls.
+    return (list of modules): all the format modules which could be loaded
+    """
+    global _loaded_iomodules
+    if _loaded_iomodules is None:
+        modules = []
+        for module_name in _iomodules:
+            try:
+                modules.append(importlib.import_module("." + module_name, "odemis.dataio"))
+            except Exception:
+                logging.info("Skipping converter %s, which failed to load",
+                             module_name, exc_info=True)
+        _loaded_iomodules = modules
+
+    return _loaded_iomodules
+
+
+# (mode, allowlossy) -> list of (extension, module), cf _get_extensions()
+_extensions = {}
+
+
+def _get_extensions(mode, allowlossy):
+    """
+    List the extensions of all the format modules fitting the mode. The list
+    is computed only the first time, and the same list is returned on the
+    next calls.
+    mode, allowlossy: cf get_available_formats()
+    return (list of (str, module)): the extension and its format module,
+      sorted from the longest to the shortest extension.
+    """
+    try:
+        return _extensions[(mode, allowlossy)]
+    except KeyError:
+        exts = [(e, conv) for conv in _get_iomodules()
+                if _is_module_fitting(conv, mode, allowlossy)
+                for e in conv.EXTENSIONS]
+        # Stable sort, so for the same length, the first module is picked
+        exts.sort(key=lambda ec: len(ec[0]), reverse=True)
+        _extensions[(mode, allowlossy)] = exts
+        return exts
+
+
+def _is_module_fitting(converter, mode, allowlossy):
+    """
+    converter (module): a format module
+    mode, allowlossy: cf get_available_formats()
+    return (bool): True if the converter supports the mode (and lossiness)
+    """
+    if not allowlossy and converter.LOSSY:
+        return False
+    return ((mode == os.O_RDWR) or
+            (mode == os.O_RDONLY and (hasattr(converter, "read_data") or hasattr(converter, "open_data"))) or
+            (mode == os.O_WRONLY and hasattr(converter, "export"))
+           )
+
+
 def get_available_formats(mode=os.O_RDWR, allowlossy=False):
     """
     Find the available file formats
@@ -55,20 +119,8 @@ def get_available_formats(mode=os.O_RDWR, allowlossy=False):
         extensions
     """
     formats = {}
-    # Look dynamically which format is available
-    for module_name in _iomodules:
-        try:
-            exporter = importlib.import_module("." + module_name, "odemis.dataio")
-        except Exception:
-            logging.info("Skipping exporter %s, which failed to load", module_name)
-            continue # module cannot be loaded
-        if not allowlossy and exporter.LOSSY:
-            logging.debug("Skipping exporter %s as it is lossy", module_name)
-            continue
-        if ((mode == os.O_RDWR) or
-            (mode == os.O_RDONLY and (hasattr(exporter, "read_data") or hasattr(exporter, "open_data"))) or
-            (mode == os.O_WRONLY and hasattr(exporter, "export"))
-           ):
+    for exporter in _get_iomodules():
+        if _is_module_fitting(exporter, mode, allowlossy):
             formats[exporter.FORMAT] = exporter.EXTENSIONS
 
     if not formats:
@@ -86,15 +138,7 @@ def get_converter(fmt):
     :raises ValueError: in case no exporter can be found
 
     """
-
-    # Look dynamically which format is available
-    for module_name in _iomodules:
-        try:
-            converter = importlib.import_module("." + module_name, "odemis.dataio")
-        except (ValueError, TypeError, ImportError):
-            logging.info("Import of converter %s failed", module_name, exc_info=True)
-            continue  # module cannot be loaded
-
+    for converter in _get_iomodules():
         if fmt == converter.FORMAT:
             return converter
 
@@ -119,10 +163,9 @@ def find_fittest_converter(filename, default=tiff, mode=os.O_WRONLY, allowlossy=
     if isinstance(fn_low, bytes):
         fn_low = fn_low.decode("ascii", errors="replace")
 
-    fmt2ext = get_available_formats(mode, allowlossy=True)
-    for fmt in fmt2ext.keys():
-        conv = get_converter(fmt)
-        if hasattr(conv, "PREFIXES") and any(fn_low.startswith(p) for p in conv.PREFIXES):
+    for conv in _get_iomodules():
+        if (_is_module_fitting(conv, mode, allowlossy=True) and
+            any(fn_low.startswith(p) for p in getattr(conv, "PREFIXES", ()))):
             return conv
 
     # Find the extension of the file
@@ -130,20 +173,11 @@ def find_fittest_converter(filename, default=tiff, mode=os.O_WRONLY, allowlossy=
     if basename == "":
         raise ValueError("Filename should have at least one letter: '%s'" % filename)
 
-    # make sure we pick the format with the longest fitting extension
-    best_len = 0
-    best_fmt = None
-    for fmt, exts in get_available_formats(mode, allowlossy).items():
-        for e in exts:
-            if fn_low.endswith(e) and len(e) > best_len:
-                best_len = len(e)
-                best_fmt = fmt
-
-    if best_fmt is not None:
-        logging.debug("Determined that '%s' corresponds to %s format",
-                      basename, best_fmt)
-        conv = get_converter(best_fmt)
-    else:
-        conv = default
-
-    return conv
+    # The extensions are sorted by length, so the longest fitting one is picked
+    for ext, conv in _get_extensions(mode, allowlossy):
+        if fn_low.endswith(ext):
+            logging.debug("Determined that '%s' corresponds to %s format",
+                          basename, conv.FORMAT)
+            return conv
+
+    return default
@@ -21,7 +21,6 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 '''
 from __future__ import division
 from past.builtins import basestring, unicode
-from numpy.polynomial import polynomial
 
 import collections
 import h5py
@@ -43,6 +42,10 @@ EXTENSIONS = [u".h5", u".hdf5"]
 LOSSY = False
 CAN_SAVE_PYRAMID = False
 
+# Maximum size of a chunk of a (compressed) dataset. It matches the default
+# size of the HDF5 chunk cache, so that a whole chunk can always be cached.
+MAX_CHUNK_SIZE = 1024 * 1024  # bytes
+
 # We are trying to follow the same format as SVI, as defined here:
 # http://www.svi.nl/HDF5
 # A file follows this structure:
@@ -128,6 +131,28 @@ _dtid = h5py.special_dtype(enum=('i', {
 _dictid = h5py.check_dtype(enum=_dtid)
 
 
+def _computeChunks(shape, itemsize):
+    """
+    Compute the shape of the chunks of a dataset, so that each chunk is at most
+    MAX_CHUNK_SIZE, and contains whole planes (ie, the last two dimensions)
+    whenever possible. As the data is always read entirely, large chunks are
+    more efficient than the small ones guessed by h5py.
+    shape (tuple of 0<ints): shape of the dataset
+    itemsize (int): size of an element in bytes
+    returns (tuple of ints): shape of a chunk
+    """
+    chunks = list(shape)
+    # Reduce the dimensions from the first one, until the chunk is small enough
+    for i in range(len(chunks)):
+        size = numpy.prod(chunks) * itemsize
+        if size <= MAX_CHUNK_SIZE:
+            break
+        rest_size = size // chunks[i]
+        chunks[i] = max(1, MAX_CHUNK_SIZE // rest_size)
+
+    return tuple(int(c) for c in chunks)
+
+
 def _create_image_dataset(group, dataset_name, image, **kwargs):
     """
     Create a dataset respecting the HDF5 image specification
@@ -139,13 +164,27 @@ def _create_image_dataset(group, dataset_name, image, **kwargs):
     returns the new dataset
     """
     assert(len(image.shape) >= 2)
-    image_dataset = group.create_dataset(dataset_name, data=image, **kwargs)
+    # Compressed datasets need to be chunked
+    if kwargs.get("compression") and "chunks" not in kwargs and image.size > 0:
+        kwargs["chunks"] = _computeChunks(image.shape, image.dtype.itemsize)
+    rgb = image.ndim == 3 and (image.shape[-3] == 3 or image.shape[-1] == 3)
+    if not rgb:
+        minmax = [image.min(), image.max()]
+
+    if not rgb and minmax[0] == minmax[1]:
+        # All the values are the same (eg, empty image) => no need to write
+        # (and compress) the data, the fill value is returned on reading
+        image_dataset = group.create_dataset(dataset_name, shape=image.shape,
+                                             dtype=image.dtype,
+                                             fillvalue=minmax[0], **kwargs)
+    else:
+        image_dataset = group.create_dataset(dataset_name, data=image, **kwargs)
 
     # numpy.string_ is to force fixed-length string (necessary for compatibility)
     # FIXME: needs to be NULLTERM, not NULLPAD... but h5py doesn't allow to distinguish
     image_dataset.attrs["CLASS"] = numpy.string_("IMAGE")
     # Colour image?
-    if image.ndim == 3 and (image.shape[-3] == 3 or image.shape[-1] == 3):
+    if rgb:
         # TODO: check dtype is int?
         image_dataset.attrs["IMAGE_SUBCLASS"] = numpy.string_("IMAGE_TRUECOLOR")
         image_dataset.attrs["IMAGE_COLORMODEL"] = numpy.string_("RGB")
@@ -158,7 +197,7 @@ def _create_image_dataset(group, dataset_name, image, **kwargs):
     else:
         image_dataset.attrs["IMAGE_SUBCLASS"] = numpy.string_("IMAGE_GRAYSCALE")
         image_dataset.attrs["IMAGE_WHITE_IS_ZERO"] = numpy.array(0, dtype="uint8")
-        image_dataset.attrs["IMAGE_MINMAXRANGE"] = [image.min(), image.max()]
+        image_dataset.attrs["IMAGE_MINMAXRANGE"] = minmax
 
     image_dataset.attrs["DISPLAY_ORIGIN"] = numpy.string_("UL") # not rotated
     image_dataset.attrs["IMAGE_VERSION"] = numpy.string_("1.2")
@@ -621,16 +660,15 @@ def _read_image_info(group):
                             # To support spectrum acquisition files, acquired before 2016, that had metadata
                             # in polynomial form. The polynomial is converted from a pixel number of a spectrum
                             # to a wavelength list.
-                            pn = polynomial.polytrim(pn)
-                            if len(pn) >= 2:
-                                npn = polynomial.Polynomial(pn,  # pylint: disable=E1101
-                                                            domain=[0, dataset.shape[i] - 1],
-                                                            window=[0, dataset.shape[i] - 1])
-                                ret = npn.linspace(dataset.shape[i])[1]
+                            # pn is always exactly (a, b) of a linear polynomial (wl = a + bx),
+                            # as only the C offset and a scalar scale are stored, so evaluate it directly.
+                            wl_offset, wl_step = pn
+                            if wl_step != 0:
+                                ret = wl_offset + wl_step * numpy.arange(dataset.shape[i])
                                 md[model.MD_WL_LIST] = ret.tolist()
                             else:
-                                # a polynomial of 0 or 1 value is useless
-                                raise ValueError("Wavelength polynomial has only %d degree" % len(pn))
+                                # all the pixels would have the same wavelength => useless
+                                raise ValueError("Wavelength polynomial has a null linear coefficient")
 
 
     except Exception:
@@ -1562,17 +1600,20 @@ def _saveAsHDF5(filename, ldata, thumbnail, compressed=True):
     f = h5py.File(filename, "w") # w will fail if file exists
     if compressed:
         # szip is not free for commercial usage and lzf doesn't seem to be
-        # well supported yet
-        compression = "gzip"
+        # well supported yet (and it barely compresses noisy 16-bit images).
+        # gzip level 1 with shuffle is ~3x faster than the default gzip level
+        # (4), and typically compresses images even better. Both filters are
+        # part of the standard HDF5 library, so any software can read them.
+        dskwargs = {"compression": "gzip", "compression_opts": 1, "shuffle": True}
     else:
-        compression = None
+        dskwargs = {}
 
     if thumbnail is not None:
         thumbnail = _mergeCorrectionMetadata(thumbnail)
         # Save the image as-is in a special group "Preview"
         prevg = f.create_group("Preview")
         _updateRGBMD(thumbnail) # ensure RGB info is there if needed
-        ids = _create_image_dataset(prevg, "Image", thumbnail, compression=compression)
+        ids = _create_image_dataset(prevg, "Image", thumbnail, **dskwargs)
         _add_image_info(prevg, ids, thumbnail)
 
     # merge correction metadata (as we cannot save them separatly in OME-TIFF)
@@ -1582,7 +1623,7 @@ def _saveAsHDF5(filename, ldata, thumbnail, compressed=True):
     acq, mds = _groupImages(ldata)
     for i, da in enumerate(acq):
         ga = f.create_group("Acquisition%d" % i)
-        _add_acquistion_svi(ga, da, mds[i], compression=compression)
+        _add_acquistion_svi(ga, da, mds[i], **dskwargs)
 
     f.close()
 
@@ -38,7 +38,9 @@ import json
 
 logging.getLogger().setLevel(logging.DEBUG)
 
-FILENAME = u"test" + hdf5.EXTENSIONS[0]
+# Include the process ID, so that the tests can run in parallel processes (eg,
+# with pytest-xdist) without writing to the same file
+FILENAME = u"test-%d%s" % (os.getpid(), hdf5.EXTENSIONS[0])
 
 
 class TestHDF5IO(unittest.TestCase):
@@ -69,11 +71,10 @@ class TestHDF5IO(unittest.TestCase):
         self.assertGreater(st.st_size, 0)
 
         f = h5py.File(FILENAME, "r")
-        # need to transform to a full numpy.array just to remove the dimensions
-        im = numpy.array(f["Acquisition0/ImageData/Image"])
-        im.shape = im.shape[3:5]
-        self.assertEqual(im.shape, data.shape)
-        self.assertEqual(im[white[-1:-3:-1]], data[white[-1:-3:-1]])
+        # only read the pixel checked, instead of the whole image
+        im = f["Acquisition0/ImageData/Image"]
+        self.assertEqual(im.shape, (1, 1, 1) + data.shape)
+        self.assertEqual(im[(0, 0, 0) + white[-1:-3:-1]], data[white[-1:-3:-1]])
 
     def testUnicodeName(self):
         """Try filename not fitting in ascii"""
@@ -94,11 +95,10 @@ class TestHDF5IO(unittest.TestCase):
         self.assertGreater(st.st_size, 0)
 
         f = h5py.File(fn, "r")
-        # need to transform to a full numpy.array just to remove the dimensions
-        im = numpy.array(f["Acquisition0/ImageData/Image"])
-        im.shape = im.shape[3:5]
-        self.assertEqual(im.shape, data.shape)
-        self.assertEqual(im[white[-1:-3:-1]], data[white[-1:-3:-1]])
+        # only read the pixel checked, instead of the whole image
+        im = f["Acquisition0/ImageData/Image"]
+        self.assertEqual(im.shape, (1, 1, 1) + data.shape)
+        self.assertEqual(im[(0, 0, 0) + white[-1:-3:-1]], data[white[-1:-3:-1]])
 
         os.remove(fn)
 
@@ -128,11 +128,10 @@ class TestHDF5IO(unittest.TestCase):
         f = h5py.File(FILENAME, "r")
 
         # check the number of channels
-        im = numpy.array(f["Acquisition0/ImageData/Image"])
+        im = f["Acquisition0/ImageData/Image"]
+        self.assertEqual(im.shape[3:5], size[::-1])
         for i in range(num):
-            subim = im[i, 0, 0] # just one channel
-            self.assertEqual(subim.shape, size[::-1])
-            self.assertEqual(subim[white], 124 + i)
+            self.assertEqual(im[(i, 0, 0) + white], 124 + i) # just one channel
 
         os.remove(FILENAME)
 
@@ -154,7 +153,7 @@ class TestHDF5IO(unittest.TestCase):
         tshape = (size[1] // 8, size[0] // 8, 3)
         tdtype = numpy.uint8
         thumbnail = model.DataArray(numpy.zeros(tshape, tdtype))
-        thumbnail[:, :, 0] += 255 # red
+        thumbnail[:, :, 0] = 255 # red
         blue = (12, 22) # non symmetric position
         thumbnail[blue[::-1]] = [0, 0, 255]
         thumbnail.metadata[model.MD_POS] = (0.1, -2)
@@ -177,10 +176,9 @@ class TestHDF5IO(unittest.TestCase):
             self.assertEqual(exp_name, dim.label)
 
         # check the number of channels
-        im = numpy.array(f["Acquisition0/ImageData/Image"])
-        for i in range(num):
-            subim = im[i, 0, 0] # just one channel
-            self.assertEqual(subim.shape, size[::-1])
+        im = f["Acquisition0/ImageData/Image"]
+        self.assertEqual(im.shape[0], num)
+        self.assertEqual(im.shape[3:5], size[::-1])
 
     def testExportCube(self):
         """
@@ -243,15 +241,19 @@ class TestHDF5IO(unittest.TestCase):
         self.assertEqual(im.shape, data3d.shape)
         self.assertEqual(im.attrs["CLASS"], b"IMAGE")
         self.assertEqual(im.attrs["IMAGE_SUBCLASS"], b"IMAGE_GRAYSCALE")
+        # chunks should contain whole planes, and fit in the chunk cache
+        self.assertEqual(im.chunks[-2:], data3d.shape[-2:])
+        self.assertLessEqual(numpy.prod(im.chunks) * im.dtype.itemsize, hdf5.MAX_CHUNK_SIZE)
 
         # check basic metadata
         self.assertEqual(im.dims[4].label, "X")
         self.assertEqual(im.dims[0].label, "C")
 
         # check the 2D data
-        im = numpy.array(f["Acquisition1/ImageData/Image"])
+        im = f["Acquisition1/ImageData/Image"][()]
         subim = im[0, 0, 0] # just one channel
         self.assertEqual(subim.shape, size[-1::-1])
+        numpy.testing.assert_array_equal(subim, 0)
 
     def testExportSpatialCube(self):
         """
@@ -372,7 +374,7 @@ class TestHDF5IO(unittest.TestCase):
         checks that the metadata is saved with every picture
         """
         size = (512, 256, 1)
-        dtype = numpy.dtype("uint16")
+        dtype = numpy.uint16
         # list instead of tuple for binning because json only uses lists
         extra_md = {"Camera" : {'binning' : ((0, 0), "px")}, u"¤³ß": {'</Image>': '</Image>'},
                     "Fake component": ("parameter", None)}
@@ -397,7 +399,7 @@ class TestHDF5IO(unittest.TestCase):
         tshape = (size[1] // 8, size[0] // 8, 3)
         tdtype = numpy.uint8
         thumbnail = model.DataArray(numpy.zeros(tshape, tdtype))
-        thumbnail[:, :, 0] += 255 # red
+        thumbnail[:, :, 0] = 255 # red
         blue = (12, 22) # non symmetric position
         thumbnail[blue[-1:-3:-1]] = [0, 0, 255]
 
@@ -449,7 +451,7 @@ class TestHDF5IO(unittest.TestCase):
         """
         # create 2 simple greyscale images
         sizes = [(512, 256), (500, 400)] # different sizes to ensure different acquisitions
-        dtype = numpy.dtype("uint16")
+        dtype = numpy.uint16
         white = (12, 52) # non symmetric position
         ldata = []
         num = 2
@@ -463,7 +465,7 @@ class TestHDF5IO(unittest.TestCase):
         tshape = (sizes[0][1] // 8, sizes[0][0] // 8, 3)
         tdtype = numpy.uint8
         thumbnail = model.DataArray(numpy.zeros(tshape, tdtype))
-        thumbnail[:, :, 0] += 255 # red
+        thumbnail[:, :, 0] = 255 # red
         blue = (12, 22) # non symmetric position
         thumbnail[blue[::-1]] = [0, 0, 255]
         thumbnail.metadata[model.MD_POS] = (0.1, -2)
@@ -532,7 +534,7 @@ class TestHDF5IO(unittest.TestCase):
                     },
                     ]
         # create 2 simple greyscale images
-        dtype = numpy.dtype("uint8")
+        dtype = numpy.uint8
         ldata = []
         for i, s in enumerate(sizes):
             a = model.DataArray(numpy.random.randint(0, 200, s[::-1], dtype), metadata[i])
@@ -542,7 +544,7 @@ class TestHDF5IO(unittest.TestCase):
         tshape = (sizes[0][1] // 8, sizes[0][0] // 8, 3)
         tdtype = numpy.uint8
         thumbnail = model.DataArray(numpy.zeros(tshape, tdtype))
-        thumbnail[:, :, 1] += 255  # green
+        thumbnail[:, :, 1] = 255  # green
 
         # export
         hdf5.export(FILENAME, ldata, thumbnail)
@@ -627,7 +629,7 @@ class TestHDF5IO(unittest.TestCase):
                      },
                     ]
         # create 2 simple greyscale images
-        dtype = numpy.dtype("uint8")
+        dtype = numpy.uint8
         ldata = []
         for i, s in enumerate(sizes):
             a = model.DataArray(numpy.random.randint(0, 200, s[::-1], dtype), metadata[i])
@@ -637,7 +639,7 @@ class TestHDF5IO(unittest.TestCase):
         tshape = (sizes[0][1] // 8, sizes[0][0] // 8, 3)
         tdtype = numpy.uint8
         thumbnail = model.DataArray(numpy.zeros(tshape, tdtype))
-        thumbnail[:, :, 1] += 255  # green
+        thumbnail[:, :, 1] = 255  # green
 
         # export
         hdf5.export(FILENAME, ldata, thumbnail)
@@ -736,7 +738,7 @@ class TestHDF5IO(unittest.TestCase):
                      },
                     ]
         # create 2 simple greyscale images
-        dtype = numpy.dtype("uint8")
+        dtype = numpy.uint8
         ldata = []
         for i, s in enumerate(sizes):
             a = model.DataArray(numpy.random.randint(0, 200, s[::-1], dtype), metadata[i])
@@ -746,7 +748,7 @@ class TestHDF5IO(unittest.TestCase):
         tshape = (sizes[0][1] // 8, sizes[0][0] // 8, 3)
         tdtype = numpy.uint8
         thumbnail = model.DataArray(numpy.zeros(tshape, tdtype))
-        thumbnail[:, :, 1] += 255  # green
+        thumbnail[:, :, 1] = 255  # green
 
         # export
         hdf5.export(FILENAME, ldata, thumbnail)
@@ -858,7 +860,7 @@ class TestHDF5IO(unittest.TestCase):
 
         # create 2 simple greyscale images
         sizes = [(512, 256), (500, 400), (500, 400)]  # different sizes to ensure different acquisitions
-        dtype = numpy.dtype("uint16")
+        dtype = numpy.uint16
         ldata = []
         for s, md in zip(sizes, metadata):
             a = model.DataArray(numpy.zeros(s[::-1], dtype), md)
@@ -868,7 +870,7 @@ class TestHDF5IO(unittest.TestCase):
         tshape = (sizes[0][1] // 8, sizes[0][0] // 8, 3)
         tdtype = numpy.uint8
         thumbnail = model.DataArray(numpy.zeros(tshape, tdtype))
-        thumbnail[:, :, 1] += 255  # green
+        thumbnail[:, :, 1] = 255  # green
 
         # export
         hdf5.export(FILENAME, ldata, thumbnail)
@@ -956,7 +958,7 @@ class TestHDF5IO(unittest.TestCase):
         # create 2 simple greyscale images
         # different sizes to ensure different acquisitions
         sizes = [(512, 256), (500, 400), (500, 400), (500, 400), (500, 400), (500, 400), (500, 400)]
-        dtype = numpy.dtype("uint16")
+        dtype = numpy.uint16
         ldata = []
         for s, md in zip(sizes, metadata):
             a = model.DataArray(numpy.zeros(s[::-1], dtype), md)
@@ -966,7 +968,7 @@ class TestHDF5IO(unittest.TestCase):
         tshape = (sizes[0][1] // 8, sizes[0][0] // 8, 3)
         tdtype = numpy.uint8
         thumbnail = model.DataArray(numpy.zeros(tshape, tdtype))
-        thumbnail[:, :, 1] += 255  # green
+        thumbnail[:, :, 1] = 255  # green
 
         # export
         hdf5.export(FILENAME, ldata, thumbnail)
@@ -1041,7 +1043,7 @@ class TestHDF5IO(unittest.TestCase):
         # create 2 simple greyscale images
         # different sizes to ensure different acquisitions
         sizes = [(512, 256), (500, 400), (500, 400), (500, 400), (500, 400), (500, 400), (500, 400)]
-        dtype = numpy.dtype("uint16")
+        dtype = numpy.uint16
         ldata = []
         for s, md in zip(sizes, metadata):
             a = model.DataArray(numpy.zeros(s[::-1], dtype), md)
@@ -1051,7 +1053,7 @@ class TestHDF5IO(unittest.TestCase):
         tshape = (sizes[0][1] // 8, sizes[0][0] // 8, 3)
         tdtype = numpy.uint8
         thumbnail = model.DataArray(numpy.zeros(tshape, tdtype))
-        thumbnail[:, :, 1] += 255  # green
+        thumbnail[:, :, 1] = 255  # green
 
         # export
         hdf5.export(FILENAME, ldata, thumbnail)
@@ -1139,7 +1141,7 @@ class TestHDF5IO(unittest.TestCase):
                     ]
         # create 3 greyscale images of same size
         size = (512, 256)
-        dtype = numpy.dtype("uint16")
+        dtype = numpy.uint16
         ldata = []
         for i, md in enumerate(metadata):
             a = model.DataArray(numpy.zeros(size[::-1], dtype), md)
@@ -1150,7 +1152,7 @@ class TestHDF5IO(unittest.TestCase):
         tshape = (size[1] // 8, size[0] // 8, 3)
         tdtype = numpy.uint8
         thumbnail = model.DataArray(numpy.zeros(tshape, tdtype))
-        thumbnail[:, :, 1] += 255 # green
+        thumbnail[:, :, 1] = 255 # green
 
         # export
         hdf5.export(FILENAME, ldata, thumbnail)
@@ -1218,7 +1220,7 @@ class TestHDF5IO(unittest.TestCase):
                     },
                     ]
         size = (512, 256)
-        dtype = numpy.dtype("uint16")
+        dtype = numpy.uint16
         ldata = []
         for i, md in enumerate(metadata):
             a = model.DataArray(numpy.zeros(size[::-1], dtype), md.copy())
@@ -1299,11 +1301,11 @@ class TestHDF5IO(unittest.TestCase):
         mnchr_size = (6, 5)
         sem_size = (128, 128)
         # Monochromator
-        mnchr_dtype = numpy.dtype("uint32")
+        mnchr_dtype = numpy.uint32
         a = model.DataArray(numpy.zeros(mnchr_size[::-1], mnchr_dtype), metadata[0])
         ldata.append(a)
         # Normal SEM
-        sem_dtype = numpy.dtype("uint16")
+        sem_dtype = numpy.uint16
         b = model.DataArray(numpy.zeros(mnchr_size[::-1], sem_dtype), metadata[1])
         ldata.append(b)
         # Anchor data
@@ -1393,7 +1395,7 @@ class TestHDF5IO(unittest.TestCase):
         # thumbnail : small RGB completely red
         tshape = (400, 300, 3)
         thumbnail = model.DataArray(numpy.zeros(tshape, numpy.uint8))
-        thumbnail[:, :, 1] += 255  # green
+        thumbnail[:, :, 1] = 255  # green
 
         # export
         hdf5.export(FILENAME, ldata, thumbnail)
@@ -31,7 +31,9 @@ from odemis.util import img
 import os
 import time
 import unittest
+from unittest import mock
 from unittest.case import skip
+import uuid
 import libtiff
 import libtiff.libtiff_ctypes as T  # for the constant names
 
@@ -91,6 +93,79 @@ class TestTiffIO(unittest.TestCase):
             self.assertEqual(im.getpixel(white), 124 + i)
             del im
 
+    def testExportEmpty(self):
+        """
+        Exporting no data shouldn't fail
+        """
+        self.no_of_images = 0
+        stiff.export(FILENAME, [])
+
+    def testExportParallel(self):
+        """
+        Check that the files written in parallel are identical to the ones
+        written one after another
+        """
+        size = (512, 256)
+        self.no_of_images = 4
+        ldata = []
+        for i in range(self.no_of_images):
+            # Different hardware => one file per image
+            md = {model.MD_HW_NAME: "cam %d" % i,
+                  model.MD_IN_WL: (500e-9, 520e-9),  # m
+                  model.MD_OUT_WL: (600e-9, 630e-9),  # m
+                  model.MD_PIXEL_SIZE: (1e-6, 1e-6),  # m/px
+                  }
+            a = model.DataArray(numpy.random.randint(0, 4096, size[::-1], dtype=numpy.uint16), md)
+            ldata.append(a)
+
+        # Same UUIDs for both exports, so that the files should be the same
+        uuids = [uuid.uuid4() for i in range(self.no_of_images)]
+        tokens = FILENAME.split(".0.", 1)
+        fnames = [tokens[0] + "." + str(i) + "." + tokens[1] for i in range(self.no_of_images)]
+
+        def export_files(ncpus):
+            """
+            Export all the data as multiple files, as if the computer had
+            ncpus CPUs.
+            return (list of int, list of bytes): the number of workers used for
+              each export, and the content of each file
+            """
+            workers = []
+            orig_executor = tiff.ThreadPoolExecutor
+
+            def executor(max_workers):
+                workers.append(max_workers)
+                return orig_executor(max_workers=max_workers)
+
+            with mock.patch.object(tiff.uuid, "uuid4", side_effect=uuids), \
+                 mock.patch.object(tiff.os, "cpu_count", return_value=ncpus), \
+                 mock.patch.object(tiff, "ThreadPoolExecutor", side_effect=executor):
+                tiff.export(FILENAME, ldata, compressed=True, multiple_files=True)
+
+            content = []
+            for fname in fnames:
+                with open(fname, "rb") as f:
+                    content.append(f.read())
+            return workers, content
+
+        # Write the files in parallel (even if this computer has a single CPU)
+        workers, par_content = export_files(ncpus=self.no_of_images)
+        self.assertEqual(workers, [self.no_of_images])
+
+        # Read every file back
+        for fname in fnames:
+            rdata = tiff.read_data(fname)
+            self.assertEqual(len(rdata), self.no_of_images)
+            for im, orig in zip(rdata, ldata):
+                numpy.testing.assert_array_equal(im.reshape(orig.shape), orig)
+                self.assertEqual(im.metadata[model.MD_HW_NAME], orig.metadata[model.MD_HW_NAME])
+
+        # Write the same files sequentially, and compare
+        workers, seq_content = export_files(ncpus=1)
+        self.assertEqual(workers, [1])
+        for fname, pc, sc in zip(fnames, par_content, seq_content):
+            self.assertEqual(pc, sc, "File %s differs from sequential export" % (fname,))
+
     def testExportOpener(self):
         # create a simple greyscale image
         size = (512, 256)
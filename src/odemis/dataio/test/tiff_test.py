@@ -1731,6 +1731,32 @@ class TestTiffIO(unittest.TestCase):
             self.assertEqual(rmd[model.MD_DIMS], emd[model.MD_DIMS])
             self.assertEqual(rmd[model.MD_POS], emd[model.MD_POS])
 
+    def testBadOMEPositions(self):
+        """
+        Checks that TiffData and Plane elements with positions outside of the
+        image are skipped, instead of failing to read the metadata.
+        """
+        ome = ('<OME><Image ID="Image:0"><Pixels DimensionOrder="XYZTC" Type="uint16" '
+               'SizeX="4" SizeY="4" SizeZ="1" SizeT="1" SizeC="3">'
+               '<Channel ID="Channel:0:0"/><Channel ID="Channel:0:1"/><Channel ID="Channel:0:2"/>'
+               '<TiffData IFD="0" FirstC="0" PlaneCount="1"/>'
+               '<TiffData IFD="1" FirstC="1" PlaneCount="1"/>'
+               '<TiffData IFD="2" FirstC="5" PlaneCount="1"/>'  # Out of range
+               '<Plane TheC="0" TheT="0" TheZ="0" ExposureTime="0.5"/>'
+               '<Plane TheC="7" TheT="0" TheZ="0" ExposureTime="2"/>'  # Out of range
+               '</Pixels></Image></OME>')
+        root = ET.fromstring(ome)
+
+        ifds, hdims = tiff._getIFDsFromOME(root.find("Image/Pixels"))
+        self.assertEqual(hdims, "CTZ")
+        self.assertEqual(ifds.ravel().tolist(), [0, 1, -1])
+
+        das = [model.DataArray(numpy.zeros((4, 4), numpy.uint16)) for i in range(3)]
+        tiff._updateMDFromOME(root, das)
+        self.assertEqual(das[0].metadata[model.MD_EXP_TIME], 0.5)
+        self.assertNotIn(model.MD_EXP_TIME, das[1].metadata)
+        self.assertNotIn(model.MD_EXP_TIME, das[2].metadata)
+
     def testReadMDTime(self):
         """
         Checks that we can read back the metadata of an acquisition with time correlation
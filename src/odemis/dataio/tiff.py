@@ -25,6 +25,7 @@ from past.builtins import basestring
 from builtins import range
 
 import calendar
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import json
 from libtiff import TIFF
@@ -167,6 +168,17 @@ def _GetFieldDefault(tfile, tag, default=None):
 # factor for value -> m
 resunit_to_m = {T.RESUNIT_INCH: 0.0254, T.RESUNIT_CENTIMETER: 0.01}
 
+# OME binning, as "XxY" (eg, "2x2")
+_BINNING_RE = re.compile(r"(?P<b1>\d+)\s*x\s*(?P<b2>\d+)")
+
+
+# TIFF string tags which are directly converted to metadata
+# (SOFTWARE is not mapped, as it's the Odemis version which wrote the file, not MD_SW_VERSION)
+_STR_TAG_TO_MD = ((T.TIFFTAG_PAGENAME, model.MD_DESCRIPTION),
+                  (T.TIFFTAG_MAKE, model.MD_HW_NAME),
+                  (T.TIFFTAG_MODEL, model.MD_HW_VERSION),
+                  )
+
 
 def _readTiffTag(tfile):
     """
@@ -207,18 +219,10 @@ def _readTiffTag(tfile):
         md[model.MD_POS] = (factor * xpos - 1, factor * ypos - 1)
 
     # informative metadata
-    val = tfile.GetField(T.TIFFTAG_PAGENAME)
-    if val is not None:
-        md[model.MD_DESCRIPTION] = val.decode("utf-8", "ignore")
-#     val = tfile.GetField(T.TIFFTAG_SOFTWARE)
-#     if val is not None:
-#         md[model.MD_SW_VERSION] = val
-    val = tfile.GetField(T.TIFFTAG_MAKE)
-    if val is not None:
-        md[model.MD_HW_NAME] = val.decode("utf-8", "ignore")
-    val = tfile.GetField(T.TIFFTAG_MODEL)
-    if val is not None:
-        md[model.MD_HW_VERSION] = val.decode("utf-8", "ignore")
+    for tag, key in _STR_TAG_TO_MD:
+        val = tfile.GetField(tag)
+        if val is not None:
+            md[key] = val.decode("utf-8", "ignore")
     val = tfile.GetField(T.TIFFTAG_DATETIME)
     if val is not None:
         try:
@@ -265,22 +269,29 @@ def _guessModelName(das):
 def _indent(elem, level=0):
     """
     In-place pretty-print formatter
-    From http://effbot.org/zone/element-lib.htm#prettyprint
+    Based on http://effbot.org/zone/element-lib.htm#prettyprint , but iterative,
+    to avoid one Python call per element.
     elem (ElementTree)
     """
-    i = u"\n" + level * u"    "
-    if len(elem):
+    if (level or len(elem)) and (not elem.tail or not elem.tail.strip()):
+        elem.tail = u"\n" + level * u"    "
+
+    todo = [(elem, level)]
+    while todo:
+        elem, level = todo.pop()
+        if not len(elem):
+            continue
+        i = u"\n" + level * u"    "
+        ci = i + u"    "  # children indentation
         if not elem.text or not elem.text.strip():
-            elem.text = i + u"    "
-        if not elem.tail or not elem.tail.strip():
-            elem.tail = i
-        for elem in elem:
-            _indent(elem, level + 1)
-        if not elem.tail or not elem.tail.strip():
-            elem.tail = i
-    else:
-        if level and (not elem.tail or not elem.tail.strip()):
-            elem.tail = i
+            elem.text = ci
+        for child in elem:
+            if not child.tail or not child.tail.strip():
+                child.tail = ci
+            todo.append((child, level + 1))
+        # last child: back to the indentation of the parent
+        if not child.tail.strip():
+            child.tail = i
 
 
 _ROI_NS = "http://www.openmicroscopy.org/Schemas/ROI/2012-06"
@@ -485,22 +496,42 @@ def _convertToOMEMD(images, multiple_files=False, findex=None, fname=None, uuids
     return ometxt
 
 
-def _findElementByID(root, eid, tag=None):
+def _indexElementsByID(root):
     """
-    Find the element with the given ID.
+    Index all the elements which have an ID.
     Note: OME conformant documents cannot have multiple elements with the same
-      ID. It is assumed to be correct.
+      ID. It is assumed to be correct, but if not, the first element is kept.
     root (ET.Element): the root element to start the search
-    eid (str): the ID to match
-    tag (str or None): the tag of the element to match. If None, any element
-      with the given ID will be looked for.
-    return (ET.Element): the element with .ID=eid, or None
+    return (dict (str, str) -> ET.Element): tag, ID -> element with this tag and ID
     """
-    for el in root.iter(tag):
-        if "ID" in el.attrib and el.attrib["ID"] == eid:
-            return el
+    elements = {}
+    for el in root.iter():
+        eid = el.get("ID")
+        if eid is not None:
+            elements.setdefault((el.tag, eid), el)
 
-    return None
+    return elements
+
+
+def _iterDAsOfIFDs(das, ifds):
+    """
+    Iterate over the DataArrays referenced by IFD numbers
+    das (list of DataArrays or None): DataArrays at the same place as the TIFF IFDs
+    ifds (numpy.array of int): the IFD numbers, with -1 if no IFD is known (it's
+      alright, might be just 3D array)
+    yields (DataArray): each DataArray present, in the order of ifds
+    """
+    ifds = numpy.asarray(ifds)
+    for ifd in ifds[ifds != -1].tolist():
+        try:
+            da = das[ifd]
+        except IndexError:
+            # That typically happens if not all the series of a
+            # serialized TIFF could be opened.
+            logging.warning("IFD %d not present, cannot update its metadata", ifd)
+            continue
+        if da is not None:  # None might be a thumbnail, it's alright
+            yield da
 
 
 def _updateMDFromOME(root, das):
@@ -515,6 +546,7 @@ def _updateMDFromOME(root, das):
     # In case of multiple files, add an offset to the ifd based on the number of
     # images found in the files that are already accessed
     ifd_offset = 0
+    id_to_el = _indexElementsByID(root)
 
     for ime in root.findall("Image"):
         md = {}
@@ -540,7 +572,7 @@ def _updateMDFromOME(root, das):
         expse = ime.find("ExperimentRef")
         if expse is not None:
             try:
-                exp = _findElementByID(root, expse.attrib["ID"], "Experiment")
+                exp = id_to_el.get(("Experiment", expse.attrib["ID"]))
                 exp_des = exp.find("Description")
                 md[model.MD_HW_NOTE] = exp_des.text
             except (AttributeError, KeyError, ValueError):
@@ -555,7 +587,7 @@ def _updateMDFromOME(root, das):
 
         objse = ime.find("ObjectiveSettings")
         try:
-            obje = _findElementByID(root, objse.attrib["ID"], "Objective")
+            obje = id_to_el.get(("Objective", objse.attrib["ID"]))
             mag = obje.attrib["CalibratedMagnification"]
             md[model.MD_LENS_MAG] = float(mag)
         except (AttributeError, KeyError, ValueError):
@@ -665,9 +697,11 @@ def _updateMDFromOME(root, das):
 
             try:
                 hex_str = che.attrib["Color"] # hex string
-                hex_str = hex_str[-8:] # almost copy of conversion.hex_to_rgb
-                tint = tuple(int(hex_str[i:i + 2], 16) for i in [0, 2, 4, 6])
-                mdc[model.MD_USER_TINT] = tint[:3] # only RGB
+                hex_str = hex_str[-8:] # RRGGBBAA
+                if len(hex_str) != 8:
+                    raise ValueError("Color %s is not RGBA" % (hex_str,))
+                v = int(hex_str, 16)
+                mdc[model.MD_USER_TINT] = ((v >> 24) & 0xFF, (v >> 16) & 0xFF, (v >> 8) & 0xFF) # only RGB
             except (KeyError, ValueError):
                 pass
 
@@ -677,8 +711,11 @@ def _updateMDFromOME(root, das):
             if d_settings is not None:
                 try:
                     bin_str = d_settings.attrib["Binning"]
-                    m = re.match(r"(?P<b1>\d+)\s*x\s*(?P<b2>\d+)", bin_str)
-                    mdc[model.MD_BINNING] = (int(m.group("b1")), int(m.group("b2")))
+                    m = _BINNING_RE.match(bin_str)
+                    if m:
+                        mdc[model.MD_BINNING] = (int(m.group("b1")), int(m.group("b2")))
+                    else:
+                        logging.info("Failed to parse binning '%s'", bin_str)
                 except KeyError:
                     pass
                 try:
@@ -699,7 +736,7 @@ def _updateMDFromOME(root, das):
             ls_settings = che.find("LightSourceSettings")
             if ls_settings is not None:
                 try:
-                    ls = _findElementByID(root, ls_settings.attrib["ID"], "LightSource")
+                    ls = id_to_el.get(("LightSource", ls_settings.attrib["ID"]))
                     try:
                         pwr = float(ls.attrib["Power"]) * 1e-3  # mW -> W
                         mdc[model.MD_LIGHT_POWER] = pwr
@@ -745,18 +782,7 @@ def _updateMDFromOME(root, das):
                     raise ValueError("Multiple channels information but C dimension is low")
                 chans = slice(None)  # all of the IFDs
 
-            for ifd in hd_2_ifd[chans].flat:
-                if ifd == -1:
-                    continue # no IFD known, it's alright, might be just 3D array
-                try:
-                    da = das[ifd]
-                except IndexError:
-                    # That typically happens if not all the series of a
-                    # serialized TIFF could be opened.
-                    logging.warning("IFD %d not present, cannot update its metadata", ifd)
-                    continue
-                if da is None:
-                    continue # might be a thumbnail, it's alright
+            for da in _iterDAsOfIFDs(das, hd_2_ifd[chans]):
                 # First apply the global MD, then per-channel
                 da.metadata.update(md)
                 da.metadata.update(mdc)
@@ -767,61 +793,40 @@ def _updateMDFromOME(root, das):
             if len(wl_list) != nbchan:
                 logging.warning("WL_LIST has length %d, while expected %d",
                                 len(wl_list), nbchan)
-            for ifd in hd_2_ifd.flat:
-                if ifd == -1:
-                    continue
-                try:
-                    da = das[ifd]
-                except IndexError:
-                    logging.warning("IFD %d not present, cannot update its metadata", ifd)
-                    continue
-                if da is None:
-                    continue
+            for da in _iterDAsOfIFDs(das, hd_2_ifd):
                 da.metadata.update({model.MD_WL_LIST: wl_list})
 
         # Plane (= one per high dim -> IFD)
         deltats = {}  # T -> DeltaT
         for ple in pxe.findall("Plane"):
+            # Optional attributes are read with .get(), as raising a KeyError
+            # for each plane is much slower than a lookup.
+            attrib = ple.attrib
             mdp = {}
             pos = []
             try:
                 for d in hdims:
-                    ds = int(ple.attrib["The%s" % d]) # required tag
+                    ds = int(attrib["The%s" % d]) # required tag
                     pos.append(ds)
             except KeyError:
                 logging.warning("Failed to parse Plane element, skipping metadata")
                 continue
 
-            try:
-                t = int(ple.attrib["TheT"])
-                deltats[t] = float(ple.attrib["DeltaT"])  # s  if key exists -> overwritten
-                # TODO can we put this code somewhere else, as time_list should be the same for all in c-dim
-            except (KeyError, ValueError):
-                pass
-
-            try:
-                # FIXME: could actually be the dwell time (if scanned)
-                mdp[model.MD_EXP_TIME] = float(ple.attrib["ExposureTime"]) # s
-            except (KeyError, ValueError):
-                pass
-
-            try:
-                mdp[model.MD_INTEGRATION_COUNT] = float(ple.attrib["IntegrationCount"])  # s
-            except (KeyError, ValueError):
-                pass
+            deltat = attrib.get("DeltaT")
+            if deltat is not None:
+                try:
+                    t = int(attrib["TheT"])
+                    deltats[t] = float(deltat)  # s  if key exists -> overwritten
+                    # TODO can we put this code somewhere else, as time_list should be the same for all in c-dim
+                except (KeyError, ValueError):
+                    pass
 
-            try:
-                # We assume it's in meters, as we write it (but there is no official unit)
-                psx = float(ple.attrib["PositionX"])
-                psy = float(ple.attrib["PositionY"])
-                mdp[model.MD_POS] = (psx, psy)
-                # MD_POS is already updated, but if a Z position is also present,
-                # we should add it as well. If not, this part will trigger a KeyError
-                psz = float(ple.attrib["PositionZ"])
-                mdp[model.MD_POS] = (psx, psy, psz)
-            except (KeyError, ValueError):
-                pass
+            if not all(0 <= p < s for p, s in zip(pos, hd_2_ifd.shape)):
+                logging.warning("Plane has position %s = %s, outside of the image shape %s, skipping metadata",
+                                hdims, pos, hd_2_ifd.shape)
+                continue
 
+            # Only parse the rest of the metadata if there is an image to update
             ifd = hd_2_ifd[tuple(pos)]
             if ifd == -1:
                 continue # no IFD known, it's alright, might be just 3D array
@@ -832,6 +837,35 @@ def _updateMDFromOME(root, das):
                 continue
             if da is None:
                 continue # might be a thumbnail, it's alright
+
+            try:
+                exp_time = attrib.get("ExposureTime")
+                if exp_time is not None:
+                    # FIXME: could actually be the dwell time (if scanned)
+                    mdp[model.MD_EXP_TIME] = float(exp_time) # s
+            except ValueError:
+                pass
+
+            try:
+                int_count = attrib.get("IntegrationCount")
+                if int_count is not None:
+                    mdp[model.MD_INTEGRATION_COUNT] = float(int_count)
+            except ValueError:
+                pass
+
+            try:
+                # We assume it's in meters, as we write it (but there is no official unit)
+                psx = attrib.get("PositionX")
+                psy = attrib.get("PositionY")
+                if psx is not None and psy is not None:
+                    mdp[model.MD_POS] = (float(psx), float(psy))
+                    # If a Z position is also present, add it as well
+                    psz = attrib.get("PositionZ")
+                    if psz is not None:
+                        mdp[model.MD_POS] = (float(psx), float(psy), float(psz))
+            except ValueError:
+                pass
+
             da.metadata.update(mdp)
 
         # Update metadata of each da, so that they will be merged
@@ -840,16 +874,7 @@ def _updateMDFromOME(root, das):
             if len(time_list) != len(deltats.keys()):
                 logging.warning("TIME_LIST has length %d, while expected %d",
                                 len(time_list), len(deltats.keys()))
-            for ifd in hd_2_ifd.flat:
-                if ifd == -1:
-                    continue
-                try:
-                    da = das[ifd]
-                except IndexError:
-                    logging.warning("IFD %d not present, cannot update its metadata", ifd)
-                    continue
-                if da is None:
-                    continue
+            for da in _iterDAsOfIFDs(das, hd_2_ifd):
                 da.metadata.update({model.MD_TIME_LIST: time_list})
 
         # Mirror data
@@ -927,7 +952,7 @@ def _updateMDFromOME(root, das):
         # ROIs (for now we only care about PolePosition)
         for roirfe in ime.findall("ROIRef"):
             try:
-                roie = _findElementByID(root, roirfe.attrib["ID"], "ROI")
+                roie = id_to_el.get(("ROI", roirfe.attrib["ID"]))
                 unione = roie.find("Union")
                 shpe = unione.find("Shape")
                 name = roie.attrib["Name"]
@@ -954,30 +979,11 @@ def _updateMDFromOME(root, das):
                     chans = slice(None)  # all
 
                 # update all the IFDs related to this channel
-                for ifd in hd_2_ifd[chans].flat:
-                    if ifd == -1:
-                        continue
-                    try:
-                        da = das[ifd]
-                    except IndexError:
-                        logging.warning("IFD %d not present, cannot update its metadata", ifd)
-                        continue
-                    if da is None:
-                        continue
+                for da in _iterDAsOfIFDs(das, hd_2_ifd[chans]):
                     # First apply the global MD, then per-channel
                     da.metadata.update(md)
 
-        # TODO make it a separate method (it is called multiple times in this method here...)
-        for ifd in hd_2_ifd.flat:
-            if ifd == -1:
-                continue
-            try:
-                da = das[ifd]
-            except IndexError:
-                logging.warning("IFD %d not present, cannot update its metadata", ifd)
-                continue
-            if da is None:
-                continue
+        for da in _iterDAsOfIFDs(das, hd_2_ifd):
             da.metadata.update(md)
 
 
@@ -1054,17 +1060,18 @@ def _getIFDsFromOME(pxe, offset=0):
         # (but for now all the files we write have PC=1)
         pc = int(tfe.get("PlaneCount", "1"))
 
-        # If PlaneCount is > 1: it's in the same order as DimensionOrder
-        for i in range(pc):
-            imsetn[tuple(pos)] = ifd + i
-            if i == (pc - 1): # don't compute next position if it's over
-                break
-            # compute next position (with modulo)
-            pos[-1] += 1
-            for d in range(len(pos) - 1, -1, -1):
-                if pos[d] >= hdshape[d]:
-                    pos[d] = 0
-                    pos[d - 1] += 1 # will fail if d = 0, on purpose
+        if not all(0 <= p < s for p, s in zip(pos, imsetn.shape)):
+            logging.warning("TiffData IFD %d has position %s = %s, outside of the image shape %s, skipping it",
+                            ifd, hdims, pos, imsetn.shape)
+            continue
+
+        # If PlaneCount is > 1: it's in the same order as DimensionOrder, so
+        # the planes are consecutive in the (C-ordered) flat array.
+        first = numpy.ravel_multi_index(pos, imsetn.shape)
+        if first + pc > imsetn.size:
+            logging.warning("TiffData IFD %d has %d planes, more than the %d remaining positions",
+                            ifd, pc, imsetn.size - first)
+        imsetn.flat[first:first + pc] = numpy.arange(ifd, ifd + pc)[:imsetn.size - first]
 
     return imsetn, hdims
 
@@ -1087,17 +1094,20 @@ def _canBeMerged(das):
     if len(das) <= 1:
         return True
 
+    def important_md(md):
+        # A key set to None is the same as not defined
+        return {k: v for k, v in md.items()
+                if k not in WHITELIST_MD_MERGE and v is not None}
+
     shape = das[0].shape
-    md = das[0].metadata.copy()
+    md = important_md(das[0].metadata)
     for da in das[1:]:
         # shape must be the same
         if shape != da.shape:
             return False
         # all the important metadata must be the same, or not defined
-        for mdk in (set(md.keys()) | set(da.metadata.keys())):
-            if (mdk not in WHITELIST_MD_MERGE and
-                md.get(mdk) != da.metadata.get(mdk)):
-                return False
+        if important_md(da.metadata) != md:
+            return False
 
     return True
 
@@ -1120,7 +1130,8 @@ def _countNeededIFDs(da):
     # RGB iif C = 3 or 4 and TZ = 1,1
     if rep_hdim[0] in (3, 4) and rep_hdim[1:] == [1, 1]:  # RGB
         rep_hdim[0] = 1
-    return numpy.prod(rep_hdim)
+    c, t, z = rep_hdim
+    return c * t * z
 
 
 def _findImageGroups(das):
@@ -1140,21 +1151,21 @@ def _findImageGroups(das):
     # * metadata that show they were acquired by the same instrument
     groups = dict()
     current_ifd = 0
-    prev_da = None
+    prev_key = None
 
     for da in das:
+        md = da.metadata
+        # Everything that must be identical to the previous DA to be in the same group
+        key = (da.shape,
+               md.get(model.MD_HW_NAME), md.get(model.MD_HW_VERSION),
+               md.get(model.MD_PIXEL_SIZE), md.get(model.MD_LIGHT_POWER),
+               md.get(model.MD_POS),
+               md.get(model.MD_ROTATION, 0), md.get(model.MD_SHEAR, 0))
         # check if it can be part of the current group (compare just to the previous DA)
-        if (prev_da is None
+        if (prev_key is None
             or da.shape[0] != 1  # If C != 1 => not possible to merge (C is always first dimension)
-            or (model.MD_IN_WL not in da.metadata or model.MD_OUT_WL not in da.metadata)
-            or prev_da.shape != da.shape
-            or prev_da.metadata.get(model.MD_HW_NAME, None) != da.metadata.get(model.MD_HW_NAME, None)
-            or prev_da.metadata.get(model.MD_HW_VERSION, None) != da.metadata.get(model.MD_HW_VERSION, None)
-            or prev_da.metadata.get(model.MD_PIXEL_SIZE) != da.metadata.get(model.MD_PIXEL_SIZE)
-            or prev_da.metadata.get(model.MD_LIGHT_POWER) != da.metadata.get(model.MD_LIGHT_POWER)
-            or prev_da.metadata.get(model.MD_POS) != da.metadata.get(model.MD_POS)
-            or prev_da.metadata.get(model.MD_ROTATION, 0) != da.metadata.get(model.MD_ROTATION, 0)
-            or prev_da.metadata.get(model.MD_SHEAR, 0) != da.metadata.get(model.MD_SHEAR, 0)
+            or (model.MD_IN_WL not in md or model.MD_OUT_WL not in md)
+            or prev_key != key
            ):
             # new group
             group_ifd = current_ifd
@@ -1162,7 +1173,7 @@ def _findImageGroups(das):
 
         # increase ifd by the number of planes
         current_ifd += _countNeededIFDs(da)
-        prev_da = da
+        prev_key = key
 
     return groups
 
@@ -1426,8 +1437,7 @@ def _addImageElement(root, das, ifd, rois, fname=None, fuuid=None):
                 if isinstance(tint, tuple):
                     if len(tint) == 3:
                         tint = tuple(tint) + (255,)  # need alpha channel
-                    hex_str = "".join("%.2x" % c for c in tint)  # copy of conversion.rgb_to_hex()
-                    chan.attrib["Color"] = "#%s" % hex_str
+                    chan.attrib["Color"] = "#%02x%02x%02x%02x" % tint  # RGBA, as conversion.rgb_to_hex()
 
             # Add info on detector
             attrib = {}
@@ -1482,14 +1492,15 @@ def _addImageElement(root, das, ifd, rois, fname=None, fuuid=None):
                 s = 1
             rep_hdim.append(s)
 
+    ci, ti, zi = hdims.index("C"), hdims.index("T"), hdims.index("Z")
     for index in numpy.ndindex(*rep_hdim):
         if fname is not None:
             tde = ET.SubElement(pixels, "TiffData", attrib={
                         # Since we have multiple files ifd is 0
                         "IFD": "%d" % subid,
-                        "FirstC": "%d" % index[hdims.index("C")],
-                        "FirstT": "%d" % index[hdims.index("T")],
-                        "FirstZ": "%d" % index[hdims.index("Z")],
+                        "FirstC": "%d" % index[ci],
+                        "FirstT": "%d" % index[ti],
+                        "FirstZ": "%d" % index[zi],
                         "PlaneCount": "1"
                         })
             f_name = ET.SubElement(tde, "UUID", attrib={
@@ -1498,9 +1509,9 @@ def _addImageElement(root, das, ifd, rois, fname=None, fuuid=None):
         else:
             tde = ET.SubElement(pixels, "TiffData", attrib={
                                     "IFD": "%d" % (ifd + subid),
-                                    "FirstC": "%d" % index[hdims.index("C")],
-                                    "FirstT": "%d" % index[hdims.index("T")],
-                                    "FirstZ": "%d" % index[hdims.index("Z")],
+                                    "FirstC": "%d" % index[ci],
+                                    "FirstT": "%d" % index[ti],
+                                    "FirstZ": "%d" % index[zi],
                                     "PlaneCount": "1"
                                     })
         subid += 1
@@ -1510,9 +1521,9 @@ def _addImageElement(root, das, ifd, rois, fname=None, fuuid=None):
     for index in numpy.ndindex(*rep_hdim):
         da = das[index[concat_axis]]
         plane = ET.SubElement(pixels, "Plane", attrib={
-                               "TheC": "%d" % index[hdims.index("C")],
-                               "TheT": "%d" % index[hdims.index("T")],
-                               "TheZ": "%d" % index[hdims.index("Z")],
+                               "TheC": "%d" % index[ci],
+                               "TheT": "%d" % index[ti],
+                               "TheZ": "%d" % index[zi],
                                })
         # Note: we used to store ACQ_DATE also in this attribute (in addition to
         # AcquisitionDate) in order to save the different acquisition date for
@@ -1522,7 +1533,7 @@ def _addImageElement(root, das, ifd, rois, fname=None, fuuid=None):
         # We now just store TIME_OFFSET + PIXEL_DUR info
         # TODO in future only use TIME_LIST
         if model.MD_PIXEL_DUR in da.metadata:
-            t = index[hdims.index("T")]
+            t = index[ti]
             deltat = da.metadata.get(model.MD_TIME_OFFSET) + da.metadata[model.MD_PIXEL_DUR] * t
             plane.attrib["DeltaT"] = "%.15f" % deltat
         if time_list is not None:
@@ -1820,17 +1831,20 @@ def _saveAsMultiTiffLT(filename, ldata, thumbnail, compressed=True, multiple_fil
             write_rgb = False
             hdim = data.shape[:-2]
 
+        if data.dtype in (numpy.int64, numpy.uint64):
+            c = None # libtiff doesn't support compression on these types
+        else:
+            c = compression
+
         for i in numpy.ndindex(*hdim):
             # Save metadata (before the image)
+            # Note: they have to be set for each page, as libtiff resets all
+            # the tags after writing a directory.
             for key, val in tags.items():
                 try:
                     f.SetField(key, val)
                 except Exception:
                     logging.exception("Failed to store tag %s with value '%s'", key, val)
-            if data[i].dtype in [numpy.int64, numpy.uint64]:
-                c = None # libtiff doesn't support compression on these types
-            else:
-                c = compression
             write_image(f, data[i], write_rgb=write_rgb, compression=c, pyramid=pyramid)
 
 
@@ -1924,10 +1938,19 @@ def export(filename, data, thumbnail=None, compressed=True, multiple_files=False
             uuid_list = []
             for i in range(nfiles):
                 uuid_list.append(uuid.uuid4().urn)
-            for i in range(nfiles):
-                # TODO: Take care of thumbnails
-                _saveAsMultiTiffLT(filename, data, None, compressed,
-                                   multiple_files, i, uuid_list, pyramid)
+            # Each file is independent, and libtiff releases the GIL while
+            # compressing and writing, so write them in parallel.
+            # libtiff is thread-safe as long as a TIFF handle is not shared
+            # between threads: each call opens its own file, and works on its
+            # own copy of the metadata (cf _mergeCorrectionMetadata()).
+            # TODO: Take care of thumbnails
+            nworkers = max(1, min(nfiles, os.cpu_count() or 1))
+            with ThreadPoolExecutor(max_workers=nworkers) as executor:
+                futures = [executor.submit(_saveAsMultiTiffLT, filename, data, None, compressed,
+                                           multiple_files, i, uuid_list, pyramid)
+                           for i in range(nfiles)]
+                for f in futures:
+                    f.result()  # Raises the exception if the writing failed
         else:
             _saveAsMultiTiffLT(filename, data, thumbnail, compressed, pyramid=pyramid)
     else: